@@ -1,12 +1,12 @@
-import os
+import importlib
 
-cd = os.path.dirname(os.path.abspath(__file__))
-os.chdir(cd)
+# submodules are imported the first time they are used as engine.<name>
+# so e.g. perft and its worker processes only load the move generator,
+# and game and display (which need pygame, which is slow to import and prints to stdout) are only loaded by the gui
+lazy_modules = ("search", "pieces", "bitboard", "move", "evaluate", "tapered_eval", "game", "display")
 
-from engine import game
-from engine import search
-from engine import pieces
-from engine import bitboard
-from engine import move
-from engine import evaluate
-from engine import tapered_eval
+
+def __getattr__(name):
+    if name in lazy_modules:
+        return importlib.import_module(f"engine.{name}")
+    raise AttributeError(f"module 'engine' has no attribute '{name}'")
@@ -3,12 +3,17 @@ from time import time
 
 from engine import move
 from engine import pieces
+from engine import tapered_eval
 
 right_starting_rooks = [1, 1 << 56]
-left_starting_rooks = [1 << 7, 7 << 63]
+left_starting_rooks = [1 << 7, 1 << 63]
 
-# zobrist hashing numbers
-max_zob = (1 << 65) - 1
+# every position set. bitboards are always kept between 0 and full_map,
+# so maps are flipped with full_map ^ bitmap rather than ~bitmap, which gives a negative int
+full_map = (1 << 64) - 1
+
+# zobrist hashing numbers, 64 bits so they fit in a uint64 array
+max_zob = (1 << 64) - 1
 
 seed(1)
 
@@ -24,6 +29,19 @@ zobrist_ep = [make_zobrist() for i in range(8)]
 
 seed(time())
 
+# the pieces' zobrists indexed by [coloured piece value][position]
+zobrist_squares = zobrist_pieces[pieces.white] + zobrist_pieces[pieces.black]
+# the combined zobrist of every castle right held, indexed by Board.get_castle_rights()
+zobrist_castles = []
+for rights in range(16):
+    zob = 0
+    for colour in range(2):
+        if rights & 1 << 2 * colour:
+            zob ^= zobrist_left_castles[colour]
+        if rights & 2 << 2 * colour:
+            zob ^= zobrist_right_castles[colour]
+    zobrist_castles.append(zob)
+
 bitset = []
 p = 1
 for _ in range(64):
@@ -64,29 +82,43 @@ def iter_bitmap(bitmap):
         bitmap &= bitmap - 1
 
 
-class Log:
-    def __init__(self, board):
-        '''
-        class to store info of a board position to be able to undo a move
-        '''
-        self.info = board.get_game_state()
-        self.zobrist = board.zobrist
-        self.piece_info = []
+# the difference in position of a pawn's single step forward
+#                white black
+pawn_step_sizes = (8, -8)
 
-    def add_piece(self, piece_type: pieces.Piece, map_position: int):
-        '''
-        adds a piece type and it's position
-        NOTE this position will be ^ed with the board's piece's position.
-        '''
-        self.piece_info.append((piece_type, map_position))
 
-    def replace(self, board):
-        for piece_type, position_map in self.piece_info:
-            board.positions[piece_type.colour][piece_type.type] ^= position_map
+def get_castle_rook_positions(colour, king_start, king_end):
+    """
+    returns the int positions the rook starts and ends at when castling
+    """
+    if king_end < king_start:  # right
+        return 56 * colour, king_end + 1
+    else:  # left
+        return 56 * colour + 7, king_end - 1
+
+
+# when True, make_move and unmake_move check every incrementally updated value against one calculated from scratch
+# this is very slow, so it should only be switched on when testing
+CHECK_CONSISTENCY = False
+# when True, the bitboards the move generator builds are checked to be between 0 and full_map
+# like CHECK_CONSISTENCY, this is slow and only for testing
+CHECK_RANGES = False
 
-        board.set_game_state(*self.info)
-        board.update_team_positions()
-        board.zobrist = self.zobrist
+
+def check_ranges(*bitmaps):
+    """
+    asserts that every bitmap given is between 0 and full_map
+    """
+    for bitmap in bitmaps:
+        assert 0 <= bitmap <= full_map, f"bitmap {bitmap} is out of range"
+
+# the number of moves the undo stack can hold before it has to grow
+undo_stack_size = 1024
+
+# the material plus piece square values that Board keeps summed for tapered_eval
+mg_piece_values = tapered_eval.mg_piece_values
+eg_piece_values = tapered_eval.eg_piece_values
+game_phase_inc = tapered_eval.game_phase_inc
 
 
 class Board:
@@ -101,6 +133,12 @@ class Board:
 
         self.all = self.team_maps[0] | self.team_maps[1]
 
+        # the coloured piece value (see pieces.coloured_values) on each position, None if empty
+        self.squares = [None for _ in range(64)]
+        for piece_value, piece_map in enumerate(self.positions[0] + self.positions[1]):
+            for position in iter_bitmap(piece_map):
+                self.squares[position] = piece_value
+
     def set_game_state(self, ep, wlc, wrc, blc, brc, move_count, hm, colour):
         '''
         initializes every game state but not the actual positions
@@ -115,7 +153,7 @@ class Board:
     def get_game_state(self):
         """
         retrieves the current game state items in the order they get called in set_game state
-        used for initialising Log
+        used for copying a board
         """
         return [self.ep_map, self.left_castles[0], self.right_castles[0], self.left_castles[1], self.right_castles[1],
                 self.current_move, self.half_moves, self.colour]
@@ -138,26 +176,142 @@ class Board:
             self.team_maps[pieces.black] |= m
         self.all = self.all = self.team_maps[0] | self.team_maps[1]
 
+    def check_consistency(self):
+        """
+        asserts that the maps, mailbox and scores that make_move and unmake_move update
+        match the ones calculated from the piece bitboards
+        """
+        check_ranges(*self.positions[0], *self.positions[1], self.ep_map, self.zobrist)
+
+        team_maps = self.team_maps[:]
+        all_map = self.all
+        self.update_team_positions()
+        assert team_maps == self.team_maps, "team maps are out of sync"
+        assert all_map == self.all, "all map is out of sync"
+        assert not self.team_maps[pieces.white] & self.team_maps[pieces.black], "a position holds both colours"
+
+        for position in range(64):
+            piece_value = None
+            for value, piece_map in enumerate(self.positions[0] + self.positions[1]):
+                if piece_map & bitset[position]:
+                    piece_value = value
+            assert self.squares[position] == piece_value, f"mailbox is out of sync at {position}"
+
+        scores = self.mg_scores, self.eg_scores, self.game_phases
+        self.create_scores()
+        assert scores == (self.mg_scores, self.eg_scores, self.game_phases), "scores are out of sync"
+
+        assert self.zobrist == self.create_zobrist(), "zobrist is out of sync"
+
+    def piece_at(self, position):
+        """
+        returns the pieces.Piece at an int position, or None if the position is empty
+        """
+        piece_value = self.squares[position]
+        if piece_value is None:
+            return None
+        return pieces.Piece(piece_value % 6, piece_value // 6)
+
+    def get_castle_rights(self):
+        """
+        packs the four castling rights into an int, used for the undo stack
+        """
+        return self.left_castles[0] | self.right_castles[0] << 1 | self.left_castles[1] << 2 | self.right_castles[1] << 3
+
+    def set_castle_rights(self, rights):
+        """
+        unpacks castling rights created by get_castle_rights
+        """
+        self.left_castles[0] = bool(rights & 1)
+        self.right_castles[0] = bool(rights & 2)
+        self.left_castles[1] = bool(rights & 4)
+        self.right_castles[1] = bool(rights & 8)
+
+    def grow_undo_stack(self):
+        """
+        doubles the size of the preallocated undo stack
+        """
+        extra = len(self.undo_zobrists)
+        self.undo_captures.extend([None] * extra)
+        self.undo_castles.extend([0] * extra)
+        self.undo_ep_maps.extend([0] * extra)
+        self.undo_half_moves.extend([0] * extra)
+        self.undo_zobrists.extend([0] * extra)
+
     def create_zobrist(self):
-        zob = 0
-        for i, team in enumerate(self.positions):
-            for j, piece_positions in enumerate(team):
-                selector = 1
-                for k in range(64):
-                    if selector & piece_positions:
-                        zob ^= zobrist_pieces[i][j][k]
-                    selector <<= 1
-        zob ^= zobrist_team * self.colour
+        """
+        calculates the zobrist hash from scratch
+        it covers the same things make_move keeps updated: pieces, colour, castle rights and the en passent file
+        """
+        zob = zobrist_castles[self.get_castle_rights()]
+        for position, piece_value in enumerate(self.squares):
+            if piece_value is not None:
+                zob ^= zobrist_squares[piece_value][position]
+        if self.ep_map:
+            zob ^= zobrist_ep[get_single_position(self.ep_map) % 8]
+        if self.colour:
+            zob ^= zobrist_team
 
         return zob
 
-    def alter_zobrist_pieces(self):
+    def create_scores(self):
+        """
+        sets the mid-game and end-game scores and game phases of each colour from scratch
+        """
+        self.mg_scores = [0, 0]
+        self.eg_scores = [0, 0]
+        self.game_phases = [0, 0]
+        for colour, team in enumerate(self.positions):
+            for piece, piece_positions in enumerate(team):
+                self.game_phases[colour] += piece_positions.bit_count() * tapered_eval.game_phase_inc[piece]
+                for position in iter_bitmap(piece_positions):
+                    self.mg_scores[colour] += tapered_eval.mg_piece_values[colour][piece][position]
+                    self.eg_scores[colour] += tapered_eval.eg_piece_values[colour][piece][position]
+
+    def put_piece(self, colour, piece_type, position):
+        """
+        places a piece onto an empty int position, updating the mailbox, zobrist and scores
+        """
+        position_map = bitset[position]
+        self.positions[colour][piece_type] ^= position_map
+        self.team_maps[colour] ^= position_map
+        self.all ^= position_map
+        self.squares[position] = piece_type + 6 * colour
+        self.zobrist ^= zobrist_pieces[colour][piece_type][position]
+        self.mg_scores[colour] += mg_piece_values[colour][piece_type][position]
+        self.eg_scores[colour] += eg_piece_values[colour][piece_type][position]
+        self.game_phases[colour] += game_phase_inc[piece_type]
+
+    def remove_piece(self, colour, piece_type, position):
+        """
+        the opposite of put_piece
         """
-        updates self.zobrist according to the data inside self.currently_altering
+        position_map = bitset[position]
+        self.positions[colour][piece_type] ^= position_map
+        self.team_maps[colour] ^= position_map
+        self.all ^= position_map
+        self.squares[position] = None
+        self.zobrist ^= zobrist_pieces[colour][piece_type][position]
+        self.mg_scores[colour] -= mg_piece_values[colour][piece_type][position]
+        self.eg_scores[colour] -= eg_piece_values[colour][piece_type][position]
+        self.game_phases[colour] -= game_phase_inc[piece_type]
+
+    def move_piece(self, colour, piece_type, start, end):
         """
-        for piece, pos_map in self.currently_altering:
-            int_position = get_single_position(pos_map)
-            self.zobrist ^= zobrist_pieces[piece.colour][piece.type][int_position]
+        moves a piece from the int position start to the empty int position end
+        """
+        move_map = bitset[start] | bitset[end]
+        self.positions[colour][piece_type] ^= move_map
+        self.team_maps[colour] ^= move_map
+        self.all ^= move_map
+        self.squares[end] = self.squares[start]
+        self.squares[start] = None
+        zobrists = zobrist_pieces[colour][piece_type]
+        self.zobrist ^= zobrists[start] ^ zobrists[end]
+        mg_values = mg_piece_values[colour][piece_type]
+        eg_values = eg_piece_values[colour][piece_type]
+        self.mg_scores[colour] += mg_values[end] - mg_values[start]
+        self.eg_scores[colour] += eg_values[end] - eg_values[start]
 
     def toggle_team_zobrist(self):
         self.zobrist ^= zobrist_team
@@ -184,6 +338,8 @@ class Board:
 
         # lists of bitmaps for each piece type
         self.positions = None
+        # the coloured piece value on each position (mailbox)
+        self.squares = None
         # bitmaps for all pieces
         self.team_maps = None
         self.all = None
@@ -197,36 +353,42 @@ class Board:
         # 0 = white, 1 = black (pieces.white/pieces.white)
         self.colour = None
         self.half_moves = None
+        # material and piece square sums for each colour, kept updated by make_move and unmake_move
+        # (see tapered_eval)
+        self.mg_scores = None
+        self.eg_scores = None
+        self.game_phases = None
 
         # a stack of the past moves that the board has made
         self.past_moves = []
 
+        # the undo stack, preallocated parallel lists indexed by the ply of the move they undo
+        # they only store what unmake_move cannot work out from the move itself
+        self.undo_count = 0
+        # the coloured piece value taken by the move, None if nothing was taken
+        self.undo_captures = [None] * undo_stack_size
+        # the state before the move (castle rights are packed by get_castle_rights)
+        self.undo_castles = [0] * undo_stack_size
+        self.undo_ep_maps = [0] * undo_stack_size
+        self.undo_half_moves = [0] * undo_stack_size
+        self.undo_zobrists = [0] * undo_stack_size
+
         self.set_positions(wp, wn, wb, wr, wq, wk, bp, bn, bb, br, bq, bk)
         self.set_game_state(ep, wlc, wrc, blc, brc, move_count, hm, colour)
 
-        # stores a list of piece positions that will be toggled when a move is made.
-        # altered and reset each make_move call
-        self.currently_altering = []  # (Piece, position_map)
-
-        self.logs: list[Log] = []
-
         self.zobrist = self.create_zobrist()
+        self.create_scores()
 
     def __repr__(self):
-        current_pieces = self.positions[0] + self.positions[1]
         string = ""
-        position = 1 << 63
         for sq in range(64):
-            for i, piece in enumerate(current_pieces):
-
-                if position & piece:
-                    string += pieces.coloured_letters[i]
-                    break
+            piece_value = self.squares[63 - sq]
+            if piece_value is not None:
+                string += pieces.coloured_letters[piece_value]
             else:
                 string += "."
             if sq % 8 == 7:
                 string += "\n"
-            position >>= 1
         return string
 
     def __hash__(self):
@@ -235,190 +397,183 @@ class Board:
     def copy(self):
         return Board(*self.positions[0], *self.positions[1], *self.get_game_state())
 
-    def make_move(self, p_move: move.Move):
+    def make_move(self, p_move: int):
         '''
-        Makes a move on the board and updates logic (e.g. current_move)
+        Makes a packed move (see engine.move) on the board and updates logic (e.g. current_move)
         NOTE this does not take legality into account.
         '''
+        colour = self.colour
+        enemy = 1 - colour
 
-        self.past_moves.append(p_move)
-
-        new_log = Log(self)
-        self.currently_altering = []
-
-        start, end = p_move.start, p_move.end
-        # map of the position the piece starts at
+        # unpack the move
+        start = p_move & move.square_mask
+        end = p_move >> move.end_shift & move.square_mask
+        flag = p_move >> move.flag_shift & move.flag_mask
 
-        for ind, map in enumerate(self.positions[self.colour]):
-            if map & start:
-                start_piece_type = ind
-                break
-        else:
+        start_piece = self.squares[start]
+        if start_piece is None or start_piece // 6 != colour:
             raise Exception("Cannot move from an empty or enemy square")
+        piece_type = start_piece - 6 * colour
+
+        # the piece on the position we end at
+        end_piece = self.squares[end]
+
+        # push the state we can't work out from the move onto the undo stack
+        undo_index = self.undo_count
+        if undo_index == len(self.undo_zobrists):
+            self.grow_undo_stack()
+        self.undo_captures[undo_index] = end_piece
+        self.undo_castles[undo_index] = self.get_castle_rights()
+        self.undo_ep_maps[undo_index] = self.ep_map
+        self.undo_half_moves[undo_index] = self.half_moves
+        self.undo_zobrists[undo_index] = self.zobrist
+        self.undo_count = undo_index + 1
+        self.past_moves.append(p_move)
 
-        if p_move.flag == move.Flags.none:
-            self.move_piece_default(start, end, start_piece_type)
-        elif p_move.flag == move.Flags.en_passent:
-            self.move_piece_ep(start, end)
-
-        elif p_move.flag == move.Flags.promotion:
-            self.move_piece_promotion(start, end, p_move.promotion_piece)
-
-        elif p_move.flag == move.Flags.castle:
-            self.move_piece_castle(start, end)
-
-        # map of the position the piece ends at
-        end_piece_type = None
-        for ind, bitmap in enumerate(self.positions[not self.colour]):
-            if bitmap & end:
-                end_piece_type = ind
-                break
-
-        if end_piece_type is not None:  # if we are taking another piece
-            self.take_piece(end, end_piece_type)
-
-
+        if end_piece is not None:  # if we are taking another piece
+            end_piece_type = end_piece - 6 * enemy
+            self.remove_piece(enemy, end_piece_type, end)
+            # castle rights removal
+            if end_piece_type == pieces.rook:
+                self.remove_single_castle(bitset[end], enemy)
+
+        if flag == move.flag_none:
+            self.move_piece(colour, piece_type, start, end)
+            if piece_type == pieces.rook:
+                self.remove_single_castle(bitset[start], colour)
+
+        elif flag == move.flag_en_passent:
+            self.move_piece(colour, pieces.pawn, start, end)
+            # remove the pawn behind the end position
+            ep_pos = end - pawn_step_sizes[colour]
+            self.remove_piece(enemy, pieces.pawn, ep_pos)
+            self.undo_captures[undo_index] = pieces.pawn + 6 * enemy
+
+        elif flag == move.flag_promotion:
+            self.remove_piece(colour, pieces.pawn, start)
+            self.put_piece(colour, p_move >> move.promotion_shift, end)
+
+        elif flag == move.flag_castle:
+            self.move_piece(colour, pieces.king, start, end)
+            rook_start, rook_end = get_castle_rook_positions(colour, start, end)
+            self.move_piece(colour, pieces.rook, rook_start, rook_end)
+            self.remove_single_castle(bitset[rook_start], colour)
 
         # update ep_map
         if self.ep_map:
             self.toggle_ep_zobrist(self.ep_map)
             self.ep_map = 0
 
-        if start_piece_type == pieces.pawn:
-            self.update_ep_map(start, end)
+        # a pawn double step leaves the position between start and end open to en passent
+        if piece_type == pieces.pawn and (end - start == 16 or start - end == 16):
+            self.ep_map = bitset[(start + end) >> 1]
+            self.toggle_ep_zobrist(self.ep_map)
 
         # remove castle rights
-        if start_piece_type == pieces.king:
-            if self.right_castles[self.colour]:
-                self.right_castles[self.colour] = False
-                self.toggle_left_castle_zobrist(self.colour)
-            if self.left_castles[self.colour]:
-                self.left_castles[self.colour] = False
-                self.toggle_right_castle_zobrist(self.colour)
-
-        for alter in self.currently_altering:
-            new_log.add_piece(*alter)
-
-        self.logs.append(new_log)
+        if piece_type == pieces.king:
+            if self.right_castles[colour]:
+                self.right_castles[colour] = False
+                self.toggle_right_castle_zobrist(colour)
+            if self.left_castles[colour]:
+                self.left_castles[colour] = False
+                self.toggle_left_castle_zobrist(colour)
 
-        self.alter_zobrist_pieces()
         self.toggle_team_zobrist()
 
-        self.currently_altering.clear()
-
         self.increment_game_state()
-        self.update_team_positions()
 
-        if end_piece_type is not None or start_piece_type == pieces.pawn:
+        if end_piece is not None or piece_type == pieces.pawn:
             self.half_moves = 0
 
+        if CHECK_CONSISTENCY:
+            self.check_consistency()
+
     def remove_single_castle(self, rook_position, colour):
         """
-        removes a castling right when a rook is moved
+        removes a castling right when a rook is moved or taken
+        the zobrist only changes if the right was still held
         """
         if rook_position & left_starting_rooks[colour]:
-            self.left_castles[colour] = False
-            self.toggle_left_castle_zobrist(colour)
+            if self.left_castles[colour]:
+                self.left_castles[colour] = False
+                self.toggle_left_castle_zobrist(colour)
         elif rook_position & right_starting_rooks[colour]:
-            self.right_castles[colour] = False
-            self.toggle_right_castle_zobrist(colour)
-
-    def move_piece_default(self, start, end, piece_type):
-        '''
-        moves the piece type from the start to end.
-        NOTE team_peices must be a direct reference to the memory location of self.whites/blacks
-        '''
-        self.positions[self.colour][piece_type] ^= start | end
+            if self.right_castles[colour]:
+                self.right_castles[colour] = False
+                self.toggle_right_castle_zobrist(colour)
 
-        altering = pieces.Piece(piece_type, self.colour)
-        self.currently_altering.append((altering, start))
-        self.currently_altering.append((altering, end))
-
-        if piece_type == pieces.rook:
-            self.remove_single_castle(start, self.colour)
-
-    def move_piece_ep(self, start, end):
-        '''
-        does the same as move_piece_default but also removes an enpassent pawn behind the end position
-        '''
-        self.move_piece_default(start, end, pieces.pawn)
-        if self.colour == pieces.white:
-            ep_pos = end >> 8
+    def unmake_move(self):
+        """
+        undoes the last move made by make_move, using the undo stack
+        """
+        p_move = self.past_moves.pop()
+        self.undo_count -= 1
+        undo_index = self.undo_count
+
+        self.colour = colour = 1 - self.colour
+        enemy = 1 - colour
+        if colour == pieces.black:
+            self.current_move -= 1
+
+        start = p_move & move.square_mask
+        end = p_move >> move.end_shift & move.square_mask
+        flag = p_move >> move.flag_shift & move.flag_mask
+
+        if flag == move.flag_promotion:
+            self.remove_piece(colour, p_move >> move.promotion_shift, end)
+            self.put_piece(colour, pieces.pawn, start)
         else:
-            ep_pos = end << 8
-
-        self.take_piece(ep_pos, pieces.pawn)
-
-
-    def move_piece_promotion(self, start, end, promotion_piece_type):
-        '''
-            does the same as move_piece_default but places the promotion type piece onto the board
-        '''
-        self.positions[self.colour][pieces.pawn] ^= start
-        self.positions[self.colour][promotion_piece_type] |= end
-
-        # pawn's original position
-        self.currently_altering.append((pieces.Piece(pieces.pawn, self.colour), start))
-        # promotion new position
-        self.currently_altering.append((pieces.Piece(promotion_piece_type, self.colour), end))
-
-    def move_piece_castle(self, start, end):
-        '''
-        does the same as move_piece_default but also removes an enpassent pawn behind the end position
-        NOTE this only needs a start and end position, as it assumes it is a king that has been moved
-        '''
-        rstart, rend = 0, 0
-        if self.colour == pieces.white:  # white
-            if end < start:
-                rstart, rend = 1, end << 1
-            elif end > start:
-                rstart, rend = 1 << 7, end >> 1
-        elif self.colour == pieces.black:
-            if end < start:
-                rstart, rend = 1 << 56, end << 1
-            elif end > start:
-                rstart, rend = 1 << 63, end >> 1
-
-        self.move_piece_default(start, end, pieces.king)
-        self.move_piece_default(rstart, rend, pieces.rook)
-
-    def take_piece(self, position, piece_type):
+            self.move_piece(colour, self.squares[end] - 6 * colour, end, start)
+            if flag == move.flag_castle:
+                rook_start, rook_end = get_castle_rook_positions(colour, start, end)
+                self.move_piece(colour, pieces.rook, rook_end, rook_start)
+
+        # put back the taken piece
+        captured = self.undo_captures[undo_index]
+        if captured is not None:
+            if flag == move.flag_en_passent:
+                end -= pawn_step_sizes[colour]
+            self.put_piece(enemy, captured - 6 * enemy, end)
+
+        self.set_castle_rights(self.undo_castles[undo_index])
+        self.ep_map = self.undo_ep_maps[undo_index]
+        self.half_moves = self.undo_half_moves[undo_index]
+        self.zobrist = self.undo_zobrists[undo_index]
+
+        if CHECK_CONSISTENCY:
+            self.check_consistency()
+
+    def make_null_move(self):
         """
-        the opposite of move_piece_default, takes a piece away from the
+        passes the turn to the other colour without moving a piece, used for null move pruning
+        only the en passent map and zobrist are pushed onto the undo stack
+        NOTE this must be undone with unmake_null_move, and it is not added to past_moves
         """
-        self.positions[not self.colour][piece_type] ^= position
-        # castle rights removal
-        if piece_type == pieces.rook:
-            self.remove_single_castle(position, not self.colour)
+        undo_index = self.undo_count
+        if undo_index == len(self.undo_zobrists):
+            self.grow_undo_stack()
+        self.undo_ep_maps[undo_index] = self.ep_map
+        self.undo_zobrists[undo_index] = self.zobrist
+        self.undo_count = undo_index + 1
+
+        # the other colour can't take en passent after a pass
+        if self.ep_map:
+            self.toggle_ep_zobrist(self.ep_map)
+            self.ep_map = 0
 
-        altering = pieces.Piece(piece_type, not self.colour)
-        self.currently_altering.append((altering, position))
+        self.toggle_team_zobrist()
+        self.colour = 1 - self.colour
 
-    def update_ep_map(self, start, end):
+    def unmake_null_move(self):
         """
-        updates the ep_map after a pawn move
+        undoes the last make_null_move
         """
-        # get the position between start and end
-        if self.colour == pieces.white:
-
-            if end >> 10 < start:  # end is not far away enough for move to have been double
-                return
-            self.ep_map = end >> 8
-
-        else:
-            if end << 10 > start:  # end is not far away enough for move to have been double
-                return
-            self.ep_map = end << 8
-
-
-        # toggle this new ep_map into our zobrist hash
-        self.toggle_ep_zobrist(self.ep_map)
+        self.undo_count -= 1
+        undo_index = self.undo_count
 
-
-    def unmake_move(self):
-        self.past_moves.pop()
-        log = self.logs.pop()
-        log.replace(self)
+        self.colour = 1 - self.colour
+        self.ep_map = self.undo_ep_maps[undo_index]
+        self.zobrist = self.undo_zobrists[undo_index]
 
     @classmethod
     def from_fen(cls, fen: str):
@@ -1,7 +1,12 @@
+import os
+
 import pygame
 from engine import pieces
 from engine import bitboard
 
+# the piece images are kept next to the engine package
+image_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "piece_images")
+
 
 # A button class used for user selection of a promotion piece
 class ImgButton:
@@ -89,42 +94,12 @@ class BoardDisplay:
                 self.debug_nums.append((text, (self.board_position_x + col * self.square_size,
                                                self.board_position_y + row * self.square_size)))
 
-        try:
-            self.images = {
-                # lights
-                pieces.Piece(pieces.bishop, pieces.white): pygame.image.load("../piece_images/wB.png"),
-                pieces.Piece(pieces.king, pieces.white): pygame.image.load("../piece_images/wK.png"),
-                pieces.Piece(pieces.knight, pieces.white): pygame.image.load("../piece_images/wN.png"),
-                pieces.Piece(pieces.pawn, pieces.white): pygame.image.load("../piece_images/wP.png"),
-                pieces.Piece(pieces.queen, pieces.white): pygame.image.load("../piece_images/wQ.png"),
-                pieces.Piece(pieces.rook, pieces.white): pygame.image.load("../piece_images/wR.png"),
-
-                # darks
-                pieces.Piece(pieces.bishop, pieces.black): pygame.image.load("../piece_images/bB.png"),
-                pieces.Piece(pieces.king, pieces.black): pygame.image.load("../piece_images/bK.png"),
-                pieces.Piece(pieces.knight, pieces.black): pygame.image.load("../piece_images/bN.png"),
-                pieces.Piece(pieces.pawn, pieces.black): pygame.image.load("../piece_images/bP.png"),
-                pieces.Piece(pieces.queen, pieces.black): pygame.image.load("../piece_images/bQ.png"),
-                pieces.Piece(pieces.rook, pieces.black): pygame.image.load("../piece_images/bR.png"),
-            }
-        except FileNotFoundError:
-            self.images = {
-                # lights
-                pieces.Piece(pieces.bishop, pieces.white): pygame.image.load("engine/piece_images/wB.png"),
-                pieces.Piece(pieces.king, pieces.white): pygame.image.load("engine/piece_images/wK.png"),
-                pieces.Piece(pieces.knight, pieces.white): pygame.image.load("engine/piece_images/wN.png"),
-                pieces.Piece(pieces.pawn, pieces.white): pygame.image.load("engine/piece_images/wP.png"),
-                pieces.Piece(pieces.queen, pieces.white): pygame.image.load("engine/piece_images/wQ.png"),
-                pieces.Piece(pieces.rook, pieces.white): pygame.image.load("engine/piece_images/wR.png"),
-
-                # darks
-                pieces.Piece(pieces.bishop, pieces.black): pygame.image.load("engine/piece_images/bB.png"),
-                pieces.Piece(pieces.king, pieces.black): pygame.image.load("engine/piece_images/bK.png"),
-                pieces.Piece(pieces.knight, pieces.black): pygame.image.load("engine/piece_images/bN.png"),
-                pieces.Piece(pieces.pawn, pieces.black): pygame.image.load("engine/piece_images/bP.png"),
-                pieces.Piece(pieces.queen, pieces.black): pygame.image.load("engine/piece_images/bQ.png"),
-                pieces.Piece(pieces.rook, pieces.black): pygame.image.load("engine/piece_images/bR.png"),
-            }
+        self.images = {}
+        for colour, colour_letter in ((pieces.white, "w"), (pieces.black, "b")):
+            for piece_type, piece_letter in ((pieces.bishop, "B"), (pieces.king, "K"), (pieces.knight, "N"),
+                                             (pieces.pawn, "P"), (pieces.queen, "Q"), (pieces.rook, "R")):
+                path = os.path.join(image_path, colour_letter + piece_letter + ".png")
+                self.images[pieces.Piece(piece_type, colour)] = pygame.image.load(path)
 
         # make instance's scaled images
         self.images = self.scale_images(self.square_size)
@@ -220,16 +195,10 @@ class BoardDisplay:
 
     # blits all current pieces to the board
     def display_pieces(self, board: bitboard.Board):
-        # create a list of the type of peice at each position
-        # None represents no piece
-        display_list = [None for _ in range(64)]
-        for colour, piece_list in enumerate(board.positions):
-            for piece_type, piece_map in enumerate(piece_list):
-                for index in bitboard.iter_bitmap(piece_map):
-                    display_list[63 - index] = pieces.Piece(piece_type, colour)  # noqa
-
         # display each piece
-        for position, piece in enumerate(display_list):
+        for position in range(64):
+            # None represents no piece
+            piece = board.piece_at(63 - position)
             if piece is None:
                 continue
             row, col = position // 8, position % 8
@@ -8,11 +8,15 @@ from engine import display
 from engine import bitboard
 from engine import move_generator
 from engine import pieces
+from engine import transposition
 
 pygame.init()
 
 starting_fen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w QKqk - 0 1"
 
+# the number of positions whose legal moves are remembered
+move_cache_size = 256
+
 
 class GameState(Enum):
     unfinished = 0
@@ -50,6 +54,8 @@ class Game:
         self.board: bitboard.Board = bitboard.Board.from_fen(starting_fen)
 
         self.generator = move_generator.Generator(self.board)
+        # the legal moves of recently seen positions, so going back over them (e.g. undoing) doesn't regenerate them
+        self.move_cache = transposition.MoveCache(move_cache_size)
 
         # True on the frame that they occur
         self.mouse_pressed = False
@@ -60,7 +66,7 @@ class Game:
         self.picked_up_position = None
         self.placed_position = None
 
-        # holds all the current legal moves for the player whose move it is
+        # holds a frozenset of all the current legal moves for the player whose move it is
         self.current_legal_moves = None
         # positions to pass to self.display to highlight when holding a piece
         self.highlight_positions = []
@@ -69,7 +75,7 @@ class Game:
 
     # updates self.current_moves to a set with every legal move the current team can make
     def update_current_moves(self):  # runs the first frame a player's move function is called
-        self.current_legal_moves = self.generator.get_legal_moves()
+        self.current_legal_moves = self.move_cache.get_legal_moves(self.generator)
 
     # returns a legal Move class (THIS IS WHERE PROMOTION IS DONE ON THE PLAYERS SIDE)
     # NOTE this requires current_legal_moves to be updated
@@ -108,25 +114,22 @@ class Game:
         # will return None if there aere no legal moves with those positions
 
     # attempts to move a piece via calling outside function (mke_move). If it is illegal, raise an exception
-    def move_piece(self, move):
-        if move not in self.current_legal_moves:
-            raise Exception(f"{move.start}-{move.end} is not in legal moves")
-        self.board.make_move(move)
+    def move_piece(self, new_move):
+        if new_move not in self.move_cache.get_legal_moves(self.generator):
+            raise Exception(f"{move.notate(new_move)} is not in legal moves")
+        self.board.make_move(new_move)
         self.current_legal_moves = None  # resets legal moves
 
     def update_move_highlights(self):
         self.highlight_positions = []
         for new_move in self.current_legal_moves:
-            if new_move.start == self.picked_up_position:
-                self.highlight_positions.append(bitboard.get_single_position(new_move.end))
+            if move.get_start_map(new_move) == self.picked_up_position:
+                self.highlight_positions.append(move.get_end(new_move))
 
     # activates the mouse "holding" a piece
     def grab_position(self, pos_map):
-        for piece_type, piece_map in enumerate(self.board.positions[self.board.colour]):
-            if piece_map & pos_map:
-                piece = pieces.Piece(piece_type, self.board.colour)
-                break
-        else:  # no friendly piece on square
+        piece = self.board.piece_at(bitboard.get_single_position(pos_map))
+        if piece is None or piece.colour != self.board.colour:  # no friendly piece on square
             return
 
         self.holding = piece
@@ -192,12 +195,12 @@ class Game:
 
     def black_ai_move(self, board):
         time.sleep(0.1)
-        legal_moves = self.generator.get_legal_moves()
+        legal_moves = self.move_cache.get_legal_moves(self.generator)
         return random.choice(list(legal_moves))
 
     def white_ai_move(self, board):
         time.sleep(0.1)
-        legal_moves = self.generator.get_legal_moves()
+        legal_moves = self.move_cache.get_legal_moves(self.generator)
         return random.choice(list(legal_moves))
 
     def set_ai(self, func, colour=pieces.white):
@@ -253,8 +256,9 @@ class Game:
         for event in events:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_SPACE:
-                    if self.debug and self.board.logs:
+                    if self.debug and self.board.past_moves:
                         self.board.unmake_move()
+                        # the moves are found again from self.move_cache, which is keyed by position
                         self.current_legal_moves = None
 
         if not self.asking_for_promotion:
@@ -272,7 +276,7 @@ class Game:
 
         if result is not None:
             # checkmate
-            if self.generator.get_attack_map() & self.board.positions[self.board.colour][pieces.king]:
+            if self.generator.is_in_check():
                 if self.board.colour == pieces.black:
                     return GameState.white_win
                 else:
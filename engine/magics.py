@@ -1,7 +1,22 @@
+import argparse
+import mmap
+import os
+import sys
+from array import array
 from random import randint
 
 max_size = 1 << 64
 
+# files are found relative to the package, so it doesn't matter where it is imported from
+package_path = os.path.dirname(os.path.abspath(__file__))
+#                    rook                bishop
+magic_file_names = ("rooks_magics.txt", "bishops_magics.txt")
+lookup_file_names = ("rook_lookups.bin", "bishop_lookups.bin")
+
+
+def get_path(file_name):
+    return os.path.join(package_path, file_name)
+
 
 def random_map():
     return randint(0, max_size - 1)
@@ -222,7 +237,7 @@ b_bits = [
 
 
 def generate_rooks():
-    with open("rooks_magics.txt", "w") as file:
+    with open(get_path(magic_file_names[False]), "w") as file:
         for square in range(64):
             # print(f"{hex(find_magic(square, r_bits[square], False))}")
             mag = hex(find_magic(square, r_bits[square], False))
@@ -231,7 +246,7 @@ def generate_rooks():
 
 
 def generate_bishops():
-    with open("bishops_magics.txt", "w") as file:
+    with open(get_path(magic_file_names[True]), "w") as file:
         for square in range(64):
             # print(f"{hex(find_magic(square, r_bits[square], False))}")
             mag = hex(find_magic(square, b_bits[square], True))
@@ -239,8 +254,29 @@ def generate_bishops():
             file.write(f"{mag}\n")
 
 
+def load_magics(is_bishop):
+    """
+    returns the magic number of every square, from rooks_magics.txt or bishops_magics.txt
+    """
+    with open(get_path(magic_file_names[is_bishop]), "r") as file:
+        return [int(line.strip(), 16) for line in file]
+
+
+def get_offsets(bits):
+    """
+    returns where each square's lookup table starts, when they are all stored one after the other
+    :param bits: r_bits or b_bits, each table has 1 << bits entries
+    """
+    offsets = []
+    offset = 0
+    for num_bits in bits:
+        offsets.append(offset)
+        offset += 1 << num_bits
+    return offsets
+
+
 def get_lookup(sq, mask, magic, num_bits, is_bishop):
-    lookup_table = [0 for _ in range(4096)]
+    lookup_table = [0 for _ in range(1 << num_bits)]
     for i in range(1 << num_bits):
         blocker_map = map_index(i, mask)
         attack_map = batt(sq, blocker_map) if is_bishop else ratt(sq, blocker_map)
@@ -249,66 +285,74 @@ def get_lookup(sq, mask, magic, num_bits, is_bishop):
     return lookup_table
 
 
+def save_lookups(is_bishop):
+    """
+    makes every square's lookup table from the saved magic numbers
+    and saves them one after the other (see get_offsets) in a single file of little endian uint64s
+    """
+    table = array("Q")
+    for sq, magic_num in enumerate(load_magics(is_bishop)):
+        mask = bmask(sq) if is_bishop else rmask(sq)
+        num_bits = b_bits[sq] if is_bishop else r_bits[sq]
+        table.extend(get_lookup(sq, mask, magic_num, num_bits, is_bishop))
+    if sys.byteorder != "little":
+        table.byteswap()
+    with open(get_path(lookup_file_names[is_bishop]), "wb") as file:
+        table.tofile(file)
+
+
 def save_rook_lookups():
-    # make lookup tables
-    lookups = []
-    with open("rooks_magics.txt", "r") as file:
-        for sq, l in enumerate(file):
-            magic_num = int(l.strip(), 16)
-            new_lookup = get_lookup(sq, rmask(sq), magic_num, r_bits[sq], False)
-            lookups.append(new_lookup)
-    # save lookup tables
-    with open("rook_lookups.txt", "w") as file:
-        for lookup in lookups:
-            line = " ".join(map(str, lookup))
-            file.write(line + "\n")
+    save_lookups(False)
 
 
 def save_bishop_lookups():
-    # make lookup tables
-    lookups = []
-    with open("bishops_magics.txt", "r") as file:
-        for sq, l in enumerate(file):
-            magic_num = int(l.strip(), 16)
-            new_lookup = get_lookup(sq, bmask(sq), magic_num, b_bits[sq], True)
-            lookups.append(new_lookup)
-    # save lookup tables
-    with open("bishop_lookups.txt", "w") as file:
-        for lookup in lookups:
-            line = " ".join(map(str, lookup))
-            file.write(line + "\n")
-
-
-class MagicLookup:
-
-    def __init__(self, sq, magic_number, lookup_table, is_bishop):
-        """
-
-        :param sq: square
-        :param magic_number: magic number for square in either rooks_magics or bishops_magics
-        :param is_bishop: whether the piece is a bishop or a rook
-        """
-        self.sq = sq
-        self.mask = bmask(sq) if is_bishop else rmask(sq)
-        self.magic = magic_number
-        self.num_bits = b_bits[sq] if is_bishop else r_bits[sq]
-        self.is_bishop = is_bishop
-        self.lookup_table = lookup_table
-
-    def __getitem__(self, all_board):
-        """
-        returns a bitmap of all the positions that a piece can reach in a given bitboard.Board.all
-        """
-        blockers = self.mask & all_board
-        ind = transform(blockers, self.magic, self.num_bits)
-        return self.lookup_table[ind]
+    save_lookups(True)
 
 
-if __name__ == '__main__':
-    #generate_rooks()
-    #generate_bishops()
-    #save_rook_lookups()
-    #save_bishop_lookups()
+def load_lookups(is_bishop):
+    """
+    returns the flat lookup table of every square, from the file made by save_lookups
+    the file is memory mapped and copied straight into a list,
+    which is much faster than parsing text and quicker to index than the mapped memory
+    the file is made first if it is missing or the wrong size
+    """
+    path = get_path(lookup_file_names[is_bishop])
+    size = sum(1 << num_bits for num_bits in (b_bits if is_bishop else r_bits))
+    if not os.path.exists(path) or os.path.getsize(path) != size * array("Q").itemsize:
+        save_lookups(is_bishop)
+
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if sys.byteorder == "little":
+                table = memoryview(mapped).cast("Q")
+            else:
+                table = array("Q", mapped)
+                table.byteswap()
+            lookups = table.tolist()
+            # the mapping can't be closed while a view of it is still open
+            del table
+    return lookups
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m engine.magics",
+                                     description="regenerate the rook and bishop lookup tables")
+    parser.add_argument("--find-magics", action="store_true",
+                        help="search for new magic numbers first (slow), instead of using the saved ones")
+    parser.add_argument("--pieces", nargs="+", choices=("rook", "bishop"), default=["rook", "bishop"])
+    args = parser.parse_args(argv)
+
+    if "rook" in args.pieces:
+        if args.find_magics:
+            generate_rooks()
+        save_rook_lookups()
+        print(f"saved {get_path(lookup_file_names[False])}")
+    if "bishop" in args.pieces:
+        if args.find_magics:
+            generate_bishops()
+        save_bishop_lookups()
+        print(f"saved {get_path(lookup_file_names[True])}")
 
 
-    pass
+if __name__ == '__main__':
+    main()
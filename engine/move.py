@@ -1,11 +1,11 @@
 from engine import pieces
 
-from enum import Enum
+from enum import IntEnum
 
 column_letters = ["a", "b", "c", "d", "e", "f", "g", "h"]
 
 
-class Flags(Enum):
+class Flags(IntEnum):
     """
     enum for every type of move.
     e.g.: Flags.en_passent
@@ -16,50 +16,123 @@ class Flags(Enum):
     castle = 3
 
 
-# a class to hold an instance of a type of move
-class Move:
-    def __init__(self, start: int, end: int, flag=Flags.none, promotion_piece=0):
+# plain int copies of Flags, used in hot paths where enum lookups are too slow
+flag_none = 0
+flag_promotion = 1
+flag_en_passent = 2
+flag_castle = 3
+
+# a move is packed into a single int:
+#   bits 0-5   start position
+#   bits 6-11  end position
+#   bits 12-13 flag
+#   bits 14-16 promotion piece type
+square_mask = 63
+flag_mask = 3
+end_shift = 6
+flag_shift = 12
+promotion_shift = 14
+
+# an empty move. start == end so it can never be legal
+no_move = 0
+
+
+def encode(start_pos: int, end_pos: int, flag=flag_none, promotion_piece=0) -> int:
+    """
+    packs int positions (0-63), a flag and a promotion piece type into a move
+    """
+    return start_pos | end_pos << end_shift | flag << flag_shift | promotion_piece << promotion_shift
+
+
+def get_start(p_move: int) -> int:
+    """
+    returns the int position the move starts at
+    """
+    return p_move & square_mask
+
+
+def get_end(p_move: int) -> int:
+    """
+    returns the int position the move ends at
+    """
+    return p_move >> end_shift & square_mask
+
+
+def get_flag(p_move: int) -> int:
+    return p_move >> flag_shift & flag_mask
+
+
+def get_promotion_piece(p_move: int) -> int:
+    return p_move >> promotion_shift
+
+
+def get_start_map(p_move: int) -> int:
+    """
+    returns the bitmap of the position the move starts at
+    """
+    return 1 << (p_move & square_mask)
+
+
+def get_end_map(p_move: int) -> int:
+    """
+    returns the bitmap of the position the move ends at
+    """
+    return 1 << (p_move >> end_shift & square_mask)
+
+
+def notate(p_move: int) -> str:
+    """
+    returns a string of the coordinate notation of a move
+    e.g. e7e8Q (promotion onto e8 into queen)
+    """
+    start_pos, end_pos = get_start(p_move), get_end(p_move)
+    #                            column                    row
+    starting = column_letters[7 - start_pos % 8] + str(start_pos // 8 + 1)
+    ending = column_letters[7 - end_pos % 8] + str(end_pos // 8 + 1)
+    promotion = ""
+    # if the move is a promotion add that piece's character onto the end
+    if get_flag(p_move) == flag_promotion:
+        promotion = str(pieces.letters[get_promotion_piece(p_move)])
+    return starting + ending + promotion
+
+
+# a thin wrapper to build a packed move from bitmaps
+# it is an int, so it compares and hashes equal to the packed move it represents
+class Move(int):
+    def __new__(cls, start: int, end: int, flag=Flags.none, promotion_piece=0):
         """
         :param start: bitmap of start position
         :param end: bitmap of end position
         :param flag: a flag from Flags(Enum)
         :param promotion_piece: the piece type to promote to if flag = Flags.promotion
         """
-        self.start = start
-        self.end = end
-        self.flag = flag
-        self.promotion_piece = promotion_piece
+        return super().__new__(cls, encode(start.bit_length() - 1, end.bit_length() - 1, int(flag), promotion_piece))
 
-    def notate(self):
+    @classmethod
+    def from_int(cls, p_move: int):
         """
-        returns a string of the coordinate notation of the move being represented
-        e.g. e7e8Q (promotion onto e8 into queen)
+        wraps an already packed move
         """
-        position = 0
-        start_pos = 0
-        end_pos = 0
-        # iterate all positions to find the int positions
-        # of the start and end points
-        while (1 << position) <= (1 << 63):
-            if self.start == 1 << position:
-                start_pos = position
-            if self.end == 1 << position:
-                end_pos = position
-            position += 1
-        #                            column                    row
-        starting = column_letters[7 - start_pos % 8] + str(start_pos // 8 + 1)
-        ending = column_letters[7 - end_pos % 8] + str(end_pos // 8 + 1)
-        promotion = ""
-        # if the move is a promotion add that piece's character onto the end
-        if self.flag == Flags.promotion:
-            promotion = str(pieces.letters[self.promotion_piece])
-        return starting + ending + promotion
+        return super().__new__(cls, p_move)
 
-    def __repr__(self):
-        return self.notate()
+    @property
+    def start(self):
+        return get_start_map(self)
+
+    @property
+    def end(self):
+        return get_end_map(self)
 
-    def __eq__(self, other):
-        if type(other) != type(self):
-            return False
-        return self.start == other.start and self.end == other.end and self.promotion_piece == other.promotion_piece and self.flag == other.flag
+    @property
+    def flag(self):
+        return Flags(get_flag(self))
 
+    @property
+    def promotion_piece(self):
+        return get_promotion_piece(self)
+
+    def notate(self):
+        return notate(self)
+
+    def __repr__(self):
+        return notate(self)
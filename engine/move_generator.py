@@ -4,14 +4,17 @@ from engine import pieces
 from engine import magics
 
 
-def map_to_moves(pos, map, flag=move.Flags.none, promotion_piece=0):
+def map_to_moves(pos, map, flag=move.flag_none, promotion_piece=0):
     """
-    converts a bitmap of the positions a piece can go to into a list of moves
+    converts a bitmap of the positions a piece can go to into a list of packed moves
     """
-    start_map = bitboard.bitset[pos]
+    if bitboard.CHECK_RANGES:
+        bitboard.check_ranges(map)
+    # every move shares the same start, flag and promotion bits
+    base = move.encode(pos, 0, flag, promotion_piece)
     moves = []
     for position in bitboard.iter_bitmap(map):
-        moves.append(move.Move(start_map, bitboard.bitset[position], flag, promotion_piece))
+        moves.append(base | position << move.end_shift)
 
     return moves
 
@@ -81,7 +84,8 @@ def generate_pawn_push_pseudo_moves():
     white_table, black_table = [], []
     for pos in range(64):
         pos_map = bitboard.bitset[pos]
-        white_table.append(pos_map << 8)
+        # shifting off the top row would go past 64 bits
+        white_table.append(pos_map << 8 & bitboard.full_map)
         black_table.append(pos_map >> 8)
     return white_table, black_table
 
@@ -98,52 +102,12 @@ def generate_pawn_attack_pseudo_moves():
         if col != 0:  # not far left
             white_map |= pos_map << 9
             black_map |= pos_map >> 7
-        white_table.append(white_map)
+        white_table.append(white_map & bitboard.full_map)
         black_table.append(black_map)
 
     return white_table, black_table
 
 
-def generate_rook_attack_pseudo_moves():
-    """
-    creates a list for the 64 positions, each holding a magic.MagicLookup table
-    """
-    magic_nums = []
-    with open("rooks_magics.txt", "r") as file:
-        for line in file:
-            magic_num = int(line.strip(), 16)
-            magic_nums.append(magic_num)
-    lookups = []
-    with open("rook_lookups.txt", "r") as file:
-        for line in file:
-            lookup = list(map(int, line.strip().split()))
-            lookups.append(lookup)
-    tables = []
-    for sq, (magic, lookup) in enumerate(zip(magic_nums, lookups)):
-        tables.append(magics.MagicLookup(sq, magic, lookup, False))
-    return tables
-
-
-def generate_bishop_attack_pseudo_moves():
-    """
-    same as rook attack but for a bishop
-    """
-    magic_nums = []
-    with open("bishops_magics.txt", "r") as file:
-        for line in file:
-            magic_num = int(line.strip(), 16)
-            magic_nums.append(magic_num)
-    lookups = []
-    with open("bishop_lookups.txt", "r") as file:
-        for line in file:
-            lookup = list(map(int, line.strip().split()))
-            lookups.append(lookup)
-    tables = []
-    for sq, (magic, lookup) in enumerate(zip(magic_nums, lookups)):
-        tables.append(magics.MagicLookup(sq, magic, lookup, True))
-    return tables
-
-
 # pseudo move lookups
 king_pseudo_lookup = generate_king_pseudo_moves()
 knight_pseudo_lookup = generate_knight_pseudo_moves()
@@ -155,15 +119,66 @@ pawn_end_rows = (0xff << 48, 0xff << 8)
 pawn_double_step_rows = (0xff << 16, 0xff << 40)
 pawn_ep_rows = (0xff << 32, 0xff << 24)
 pawn_step_sizes = (8, -8)  # only used when getting double steps
+# the far left and far right columns
+a_file_map = 0x8080808080808080
+h_file_map = 0x0101010101010101
+not_a_file_map = bitboard.full_map ^ a_file_map
+not_h_file_map = bitboard.full_map ^ h_file_map
 
 pawn_attack_lookups = generate_pawn_attack_pseudo_moves()
 
-rook_attack_lookups = generate_rook_attack_pseudo_moves()
+# magic bitboards (see engine.magics)
+# the attacks for every square are stored one after the other in a single list, starting at the square's offset
+# and are indexed by the top bits of (occupancy & mask) * magic, so a lookup is
+#   table[offset + ((occupancy & mask) * magic & magic_mask) >> shift]
+magic_mask = bitboard.full_map
+
+rook_magics = magics.load_magics(False)
+rook_masks = [magics.rmask(pos) for pos in range(64)]
+rook_shifts = [64 - num_bits for num_bits in magics.r_bits]
+rook_offsets = magics.get_offsets(magics.r_bits)
+rook_table = magics.load_lookups(False)
+
+bishop_magics = magics.load_magics(True)
+bishop_masks = [magics.bmask(pos) for pos in range(64)]
+bishop_shifts = [64 - num_bits for num_bits in magics.b_bits]
+bishop_offsets = magics.get_offsets(magics.b_bits)
+bishop_table = magics.load_lookups(True)
+
+
+def rook_attacks(pos, occupancy):
+    """
+    returns a bitmap of every position a rook on pos attacks, blocked by the pieces in occupancy
+    """
+    return rook_table[rook_offsets[pos] + (((occupancy & rook_masks[pos]) * rook_magics[pos] & magic_mask)
+                                           >> rook_shifts[pos])]
+
+
+def bishop_attacks(pos, occupancy):
+    """
+    returns a bitmap of every position a bishop on pos attacks, blocked by the pieces in occupancy
+    """
+    return bishop_table[bishop_offsets[pos] + (((occupancy & bishop_masks[pos]) * bishop_magics[pos] & magic_mask)
+                                               >> bishop_shifts[pos])]
 
-bishop_attack_lookups = generate_bishop_attack_pseudo_moves()
 
 promotion_pieces = (pieces.knight, pieces.bishop, pieces.rook, pieces.queen)
 
+# the positions a rook or bishop could reach on an empty board
+rook_rays = [rook_attacks(pos, 0) for pos in range(64)]
+bishop_rays = [bishop_attacks(pos, 0) for pos in range(64)]
+
+
+def check_lookup_ranges():
+    """
+    asserts that every bitmap in the lookup tables above is between 0 and bitboard.full_map
+    called when a Generator is made with bitboard.CHECK_RANGES on
+    """
+    bitboard.check_ranges(*king_pseudo_lookup, *knight_pseudo_lookup, *rook_rays, *bishop_rays,
+                          *rook_table, *bishop_table)
+    for colour in range(2):
+        bitboard.check_ranges(*pawn_push_lookups[colour], *pawn_attack_lookups[colour])
+
 
 class Generator:
 
@@ -174,7 +189,7 @@ class Generator:
         return knight_pseudo_lookup[pos]
 
     def pseudo_pawn(self, pos):
-        nall = ~self.board.all
+        nall = bitboard.full_map ^ self.board.all
         # bitmap for one step forward of the pawn
         forward_map = pawn_push_lookups[self.board.colour][pos]
         forward_map &= nall  # cannot be stepping on another piece
@@ -188,10 +203,12 @@ class Generator:
         return forward_map | attack_map
 
     def pseudo_rook(self, pos):
-        return rook_attack_lookups[pos][self.board.all]
+        return rook_table[rook_offsets[pos] + (((self.board.all & rook_masks[pos]) * rook_magics[pos] & magic_mask)
+                                               >> rook_shifts[pos])]
 
     def pseudo_bishop(self, pos):
-        return bishop_attack_lookups[pos][self.board.all]
+        return bishop_table[bishop_offsets[pos] + (((self.board.all & bishop_masks[pos]) * bishop_magics[pos]
+                                                    & magic_mask) >> bishop_shifts[pos])]
 
     def pseudo_queen(self, pos):
         # just gets both bishop and rook
@@ -203,14 +220,10 @@ class Generator:
         NOTE self.board is a reference to a board, so will change along with the board in game changing
         """
         self.board = board
-
-        self.not_team_map = None
-        self.pin_masks = None
-        self.check_mask = None
-        self.attack_map = None
+        if bitboard.CHECK_RANGES:
+            check_lookup_ranges()
 
         # the methods that should be called to get the pseudo legal moves for each piece type
-        # this is only used in get_attack_map
         self.pseudo_methods = [self.pseudo_pawn, self.pseudo_knight, self.pseudo_bishop,
                                self.pseudo_rook, self.pseudo_queen, self.pseudo_king]
 
@@ -265,7 +278,7 @@ class Generator:
         king_map = self.board.positions[self.board.colour][pieces.king]
         king_pos = bitboard.get_single_position(king_map)
 
-        result = ~0
+        result = bitboard.full_map
 
         # used to check for double checks
         already_checked = False
@@ -316,54 +329,171 @@ class Generator:
 
         return result
 
-    def get_pin_masks(self, king_pos):
+    def is_in_check(self):
         """
-        generates pin masks for every position on the board
+        whether the current colour's king is attacked
+        cheaper than get_check_mask when only a yes or no is needed
         """
-        # set all the masks to all 1s by default
-        masks = [~0 for _ in range(64)]
+        king_pos = bitboard.get_single_position(self.board.positions[self.board.colour][pieces.king])
+        enemies = self.board.positions[not self.board.colour]
 
-        # positions of enemy attackers
-        rook_pos = self.board.positions[not self.board.colour][pieces.rook]
-        bishop_pos = self.board.positions[not self.board.colour][pieces.bishop]
-        queen_pos = self.board.positions[not self.board.colour][pieces.queen]
+        if knight_pseudo_lookup[king_pos] & enemies[pieces.knight]:
+            return True
+        if pawn_attack_lookups[self.board.colour][king_pos] & enemies[pieces.pawn]:
+            return True
+        if self.pseudo_rook(king_pos) & (enemies[pieces.rook] | enemies[pieces.queen]):
+            return True
+        if self.pseudo_bishop(king_pos) & (enemies[pieces.bishop] | enemies[pieces.queen]):
+            return True
+        return False
 
-        rook_pseudo = rook_attack_lookups[king_pos][self.board.all]
-        team_rook_pseudo = rook_pseudo & self.board.team_maps[self.board.colour]
-        # we will be using this to iterate through the positions
-        team_rook_iterator = team_rook_pseudo
-        while team_rook_iterator:
-            # get the next position in team_rook_pseudo
-            new_position = team_rook_iterator & -team_rook_iterator
-            # iterate through team_rook_iterator
-            team_rook_iterator &= team_rook_iterator - 1
-            # get the pseudo moves but ignoring the position
-            new_rook_pseudo = rook_attack_lookups[king_pos][self.board.all ^ new_position]
-            # if our piece is being pinned by a rook/queen
-            if new_rook_pseudo & (rook_pos | queen_pos) & ~rook_pseudo:
-                new_pos = bitboard.get_single_position(new_position)
-                new_position_pseudo = rook_attack_lookups[new_pos][self.board.all]
-                masks[new_pos] &= new_position_pseudo & new_rook_pseudo
-
-        # now the same for bishops
-
-        bishop_pseudo = bishop_attack_lookups[king_pos][self.board.all]
-        team_bishop_pseudo = bishop_pseudo & self.board.team_maps[self.board.colour]
-        team_bishop_iterator = team_bishop_pseudo
-        while team_bishop_iterator:
-            # get the next position in team_bishop_pseudo
-            new_position = team_bishop_iterator & -team_bishop_iterator
-            # iterate through team_rook_iterator
-            team_bishop_iterator &= team_bishop_iterator - 1
-            # get the pseudo moves but ignoring the position
-            new_bishop_pseudo = bishop_attack_lookups[king_pos][self.board.all ^ new_position]
-            # if our piece is being pinned by a bishop/queen
-            if new_bishop_pseudo & (bishop_pos | queen_pos) & ~bishop_pseudo:
-                new_pos = bitboard.get_single_position(new_position)
-                new_position_pseudo = bishop_attack_lookups[new_pos][self.board.all]
-                masks[new_pos] &= new_position_pseudo & new_bishop_pseudo
-
-        return masks
+    def is_attacked(self, pos, occupancy):
+        """
+        whether the opposition attacks a position, with sliders blocked by the occupancy bitmap given
+        """
+        enemies = self.board.positions[not self.board.colour]
+        return bool(knight_pseudo_lookup[pos] & enemies[pieces.knight] or
+                    pawn_attack_lookups[self.board.colour][pos] & enemies[pieces.pawn] or
+                    king_pseudo_lookup[pos] & enemies[pieces.king] or
+                    rook_attacks(pos, occupancy) & (enemies[pieces.rook] | enemies[pieces.queen]) or
+                    bishop_attacks(pos, occupancy) & (enemies[pieces.bishop] | enemies[pieces.queen]))
+
+    def attackers_to(self, pos, occupancy):
+        """
+        returns a bitmap of every piece, of either colour, that attacks a position
+        sliders are blocked by the occupancy bitmap given
+        NOTE pieces missing from the occupancy are still included, so mask the result with it if they have been taken
+        """
+        white, black = self.board.positions
+        rooks = white[pieces.rook] | white[pieces.queen] | black[pieces.rook] | black[pieces.queen]
+        bishops = white[pieces.bishop] | white[pieces.queen] | black[pieces.bishop] | black[pieces.queen]
+        # a pawn attacks pos if a pawn of the other colour on pos would attack it
+        return (pawn_attack_lookups[pieces.black][pos] & white[pieces.pawn] |
+                pawn_attack_lookups[pieces.white][pos] & black[pieces.pawn] |
+                knight_pseudo_lookup[pos] & (white[pieces.knight] | black[pieces.knight]) |
+                king_pseudo_lookup[pos] & (white[pieces.king] | black[pieces.king]) |
+                rook_attacks(pos, occupancy) & rooks |
+                bishop_attacks(pos, occupancy) & bishops)
+
+    def get_pins(self, king_pos):
+        """
+        returns every friendly piece pinned to the king as (position, ray) pairs
+        ray is every position the pinned piece can still move to, including taking the pinner
+        """
+        pins = []
+        board = self.board
+        enemies = board.positions[not board.colour]
+        team_map = board.team_maps[board.colour]
+
+        for attacks, ray_lookup, sliders in (
+                (rook_attacks, rook_rays, enemies[pieces.rook] | enemies[pieces.queen]),
+                (bishop_attacks, bishop_rays, enemies[pieces.bishop] | enemies[pieces.queen])):
+            # nothing can be pinned along these lines if no enemy slider is even on them
+            if not ray_lookup[king_pos] & sliders:
+                continue
+            king_pseudo = attacks(king_pos, board.all)
+            for new_position in bitboard.iter_bitmap(king_pseudo & team_map):
+                new_position_map = bitboard.bitset[new_position]
+                # get the pseudo moves but ignoring the position
+                new_king_pseudo = attacks(king_pos, board.all ^ new_position_map)
+                # if our piece is being pinned by a slider
+                if new_king_pseudo & sliders & (bitboard.full_map ^ king_pseudo):
+                    new_position_pseudo = attacks(new_position, board.all)
+                    pins.append((new_position, new_position_pseudo & new_king_pseudo))
+
+        return pins
+
+    def get_discoverers(self, king_pos):
+        """
+        returns every friendly piece blocking one of our sliders from the enemy king, as (position, ray) pairs
+        ray is every position between the king and the slider, including the slider
+        moving the piece anywhere off its ray gives a discovered check
+        """
+        discoverers = []
+        board = self.board
+        friends = board.positions[board.colour]
+        team_map = board.team_maps[board.colour]
+
+        for attacks, ray_lookup, sliders in (
+                (rook_attacks, rook_rays, friends[pieces.rook] | friends[pieces.queen]),
+                (bishop_attacks, bishop_rays, friends[pieces.bishop] | friends[pieces.queen])):
+            if not ray_lookup[king_pos] & sliders:
+                continue
+            king_pseudo = attacks(king_pos, board.all)
+            for position in bitboard.iter_bitmap(king_pseudo & team_map):
+                new_king_pseudo = attacks(king_pos, board.all ^ bitboard.bitset[position])
+                slider_map = new_king_pseudo & sliders & (bitboard.full_map ^ king_pseudo)
+                if slider_map:
+                    slider_pos = bitboard.get_single_position(slider_map)
+                    ray = new_king_pseudo & attacks(slider_pos, board.all ^ bitboard.bitset[position]) | slider_map
+                    discoverers.append((position, ray))
+
+        return discoverers
+
+    def get_check_info(self):
+        """
+        returns a new CheckInfo for the current position
+        """
+        return CheckInfo(self)
+
+    def gives_check(self, p_move, check_info=None):
+        """
+        whether a legal move puts the opposition in check, without making it
+        :param check_info: the position's CheckInfo, so it is only made once for every move of a position
+        """
+        if check_info is None:
+            check_info = CheckInfo(self)
+        start, end = p_move & move.square_mask, p_move >> move.end_shift & move.square_mask
+        flag = p_move >> move.flag_shift & move.flag_mask
+        if flag != move.flag_none:
+            return self.gives_special_check(p_move, check_info)
+
+        end_map = bitboard.bitset[end]
+        # direct check
+        if check_info.check_squares[self.board.squares[start] % 6] & end_map:
+            return True
+        # discovered check
+        if check_info.discoverer_map & bitboard.bitset[start]:
+            return not check_info.get_ray(start) & end_map
+        return False
+
+    def gives_special_check(self, p_move, check_info):
+        """
+        gives_check for promotions, en passent and castling
+        these move or remove more than one piece, so the sliders' attacks on the king are found again from scratch
+        """
+        board = self.board
+        friends = board.positions[board.colour]
+        start, end = move.get_start(p_move), move.get_end(p_move)
+        flag = move.get_flag(p_move)
+        start_map, end_map = bitboard.bitset[start], bitboard.bitset[end]
+
+        occupancy = board.all ^ start_map | end_map
+        rooks = friends[pieces.rook] | friends[pieces.queen]
+        bishops = friends[pieces.bishop] | friends[pieces.queen]
+
+        if flag == move.flag_promotion:
+            promotion_piece = move.get_promotion_piece(p_move)
+            if promotion_piece == pieces.knight:
+                if knight_pseudo_lookup[check_info.king_pos] & end_map:
+                    return True
+            if promotion_piece == pieces.rook or promotion_piece == pieces.queen:
+                rooks |= end_map
+            if promotion_piece == pieces.bishop or promotion_piece == pieces.queen:
+                bishops |= end_map
+        elif flag == move.flag_en_passent:
+            if check_info.check_squares[pieces.pawn] & end_map:
+                return True
+            # the taken pawn is next to the end position, in the row the pawn started on
+            occupancy ^= bitboard.bitset[start // 8 * 8 + end % 8]
+        else:  # castle
+            rook_start, rook_end = bitboard.get_castle_rook_positions(board.colour, start, end)
+            rook_move_map = bitboard.bitset[rook_start] | bitboard.bitset[rook_end]
+            occupancy ^= rook_move_map
+            rooks ^= rook_move_map
+
+        return bool(rook_attacks(check_info.king_pos, occupancy) & rooks or
+                    bishop_attacks(check_info.king_pos, occupancy) & bishops)
 
     def is_pinned(self, pos_map):
         king_pos = bitboard.get_single_position(self.board.positions[self.board.colour][pieces.king])
@@ -371,115 +501,112 @@ class Generator:
         bishop_pos = self.board.positions[not self.board.colour][pieces.bishop]
         queen_pos = self.board.positions[not self.board.colour][pieces.queen]
 
-        rook_pseudo = rook_attack_lookups[king_pos][self.board.all]
+        rook_pseudo = rook_attacks(king_pos, self.board.all)
         # pseudo moves without that position in place
-        new_rook_pseudo = rook_attack_lookups[king_pos][self.board.all ^ pos_map]
+        new_rook_pseudo = rook_attacks(king_pos, self.board.all ^ pos_map)
         # the new pseudo contains rooks or queens and they are not already there
-        if new_rook_pseudo & (rook_pos | queen_pos) & ~rook_pseudo:
+        if new_rook_pseudo & (rook_pos | queen_pos) & (bitboard.full_map ^ rook_pseudo):
             return True
 
-        bishop_pseudo = bishop_attack_lookups[king_pos][self.board.all]
+        bishop_pseudo = bishop_attacks(king_pos, self.board.all)
         # pseudo moves without that position in place
-        new_bishop_pseudo = bishop_attack_lookups[king_pos][self.board.all ^ pos_map]
+        new_bishop_pseudo = bishop_attacks(king_pos, self.board.all ^ pos_map)
         # the new pseudo contains rbishop or queens and they are not already there
-        if new_bishop_pseudo & (bishop_pos | queen_pos) & ~bishop_pseudo:
+        if new_bishop_pseudo & (bishop_pos | queen_pos) & (bitboard.full_map ^ bishop_pseudo):
             return True
 
         return False
 
-    def get_legal_pawn_moves(self):
+    def get_legality(self):
+        """
+        returns a new Legality for the current position
+        """
+        return Legality(self)
+
+    def get_legal_piece_moves(self, piece_type, legality, targets):
+        """
+        returns the legal moves of every knight, bishop, rook or queen that land on targets
+        """
+        moves = []
+        pseudo_method = self.pseudo_methods[piece_type]
+        mask = legality.check_mask & targets
+        pinned_map = legality.pinned_map
+        for position in bitboard.iter_bitmap(self.board.positions[self.board.colour][piece_type]):
+            legal_moves = pseudo_method(position) & mask
+            if pinned_map & bitboard.bitset[position]:
+                legal_moves &= legality.get_pin_mask(position)
+            moves.extend(map_to_moves(position, legal_moves))
+        return moves
+
+    def get_legal_pawn_moves(self, legality, targets):
         moves = []
         position_map = self.board.positions[self.board.colour][pieces.pawn]
         end_row = pawn_end_rows[self.board.colour]
-        position_map &= ~end_row
+        position_map &= bitboard.full_map ^ end_row
 
+        mask = legality.check_mask & targets
+        pinned_map = legality.pinned_map
         for position in bitboard.iter_bitmap(position_map):
-            pin_mask = self.pin_masks[position]
-
-            pseudo_moves = self.pseudo_pawn(position)
-
-            legal_moves = pseudo_moves & self.check_mask & pin_mask & self.not_team_map
+            legal_moves = self.pseudo_pawn(position) & mask
+            if pinned_map & bitboard.bitset[position]:
+                legal_moves &= legality.get_pin_mask(position)
             moves.extend(map_to_moves(position, legal_moves))
 
         return moves
 
-    def get_legal_knight_moves(self):
-        moves = []
-        position_map = self.board.positions[self.board.colour][pieces.knight]
-        for position in bitboard.iter_bitmap(position_map):
-            pin_mask = self.pin_masks[position]
-            pseudo_moves = knight_pseudo_lookup[position]
-            legal_moves = pseudo_moves & self.check_mask & pin_mask & self.not_team_map
-            moves.extend(map_to_moves(position, legal_moves))
-        return moves
+    def get_legal_knight_moves(self, legality, targets):
+        return self.get_legal_piece_moves(pieces.knight, legality, targets)
 
-    def get_legal_bishop_moves(self):
-        moves = []
-        position_map = self.board.positions[self.board.colour][pieces.bishop]
-        for position in bitboard.iter_bitmap(position_map):
-            pin_mask = self.pin_masks[position]
-            pseudo_moves = self.pseudo_bishop(position)
-            legal_moves = pseudo_moves & self.check_mask & pin_mask & self.not_team_map
-            moves.extend(map_to_moves(position, legal_moves))
-        return moves
+    def get_legal_bishop_moves(self, legality, targets):
+        return self.get_legal_piece_moves(pieces.bishop, legality, targets)
 
-    def get_legal_rook_moves(self):
-        moves = []
-        position_map = self.board.positions[self.board.colour][pieces.rook]
-        for position in bitboard.iter_bitmap(position_map):
-            pin_mask = self.pin_masks[position]
-            pseudo_moves = self.pseudo_rook(position)
-            legal_moves = pseudo_moves & self.check_mask & pin_mask & self.not_team_map
-            moves.extend(map_to_moves(position, legal_moves))
-        return moves
+    def get_legal_rook_moves(self, legality, targets):
+        return self.get_legal_piece_moves(pieces.rook, legality, targets)
 
-    def get_legal_queen_moves(self):
-        moves = []
-        position_map = self.board.positions[self.board.colour][pieces.queen]
-        for position in bitboard.iter_bitmap(position_map):
-            pin_mask = self.pin_masks[position]
-            pseudo_moves = self.pseudo_queen(position)
-            legal_moves = pseudo_moves & self.check_mask & pin_mask & self.not_team_map
-            moves.extend(map_to_moves(position, legal_moves))
-        return moves
+    def get_legal_queen_moves(self, legality, targets):
+        return self.get_legal_piece_moves(pieces.queen, legality, targets)
 
-    def get_castling_moves(self):
+    def get_castling_moves(self, legality):
         result = []
         king_pos = self.board.positions[self.board.colour][pieces.king]
-        other_positions = self.board.all & ~king_pos
+        other_positions = self.board.all ^ king_pos
+        right_castle = self.board.right_castles[self.board.colour] is True
+        left_castle = self.board.left_castles[self.board.colour] is True
+        # can't castle out of check
+        if not (right_castle or left_castle) or legality.check_mask != bitboard.full_map:
+            return result
 
         # right
-        if self.board.right_castles[self.board.colour] is True:
+        if right_castle:
             covered_positions = king_pos | king_pos >> 1 | king_pos >> 2
-            if not (covered_positions & self.attack_map) and not (covered_positions & other_positions):
-                result.extend(map_to_moves(bitboard.get_single_position(king_pos), king_pos >> 2, move.Flags.castle))
+            if not (covered_positions & other_positions) and not (covered_positions & legality.attack_map):
+                result.extend(map_to_moves(bitboard.get_single_position(king_pos), king_pos >> 2, move.flag_castle))
 
         # left
-        if self.board.left_castles[self.board.colour] is True:
+        if left_castle:
             covered_positions = king_pos | king_pos << 1 | king_pos << 2 | king_pos << 3
             no_attack_positions = king_pos | king_pos << 1 | king_pos << 2
-            if not (no_attack_positions & self.attack_map) and not (covered_positions & other_positions):
+            if not (covered_positions & other_positions) and not (no_attack_positions & legality.attack_map):
                 result.extend(
-                    map_to_moves(bitboard.get_single_position(king_pos), king_pos << 2, move.Flags.castle))
+                    map_to_moves(bitboard.get_single_position(king_pos), king_pos << 2, move.flag_castle))
 
         return result
 
-
-    def get_promotion_moves(self):
+    def get_promotion_moves(self, legality, targets, promote_to=promotion_pieces):
         moves = []
         end_row = pawn_end_rows[self.board.colour]
         position_map = self.board.positions[self.board.colour][pieces.pawn]
         position_map &= end_row
         for position in bitboard.iter_bitmap(position_map):
-            pin_mask = self.pin_masks[position]
+            pin_mask = legality.get_pin_mask(position)
             pseudo_moves = self.pseudo_pawn(position)
-            legal_moves = pseudo_moves & self.check_mask & pin_mask & self.not_team_map
-            for piece in promotion_pieces:
-                moves.extend(map_to_moves(position, legal_moves, flag=move.Flags.promotion, promotion_piece=piece))
+            legal_moves = pseudo_moves & legality.check_mask & pin_mask & targets
+            for piece in promote_to:
+                moves.extend(map_to_moves(position, legal_moves, flag=move.flag_promotion, promotion_piece=piece))
 
         return moves
 
-    def get_en_passent_moves(self):
+    def get_en_passent_moves(self, legality):
         result = []
         # a pawn didn't double step last move
         if not self.board.ep_map:
@@ -503,14 +630,14 @@ class Generator:
             return result
 
         # allow the ep position into the check mask IF the pawn being attacked is checking the king
-        altered_check_mask = self.check_mask
+        altered_check_mask = legality.check_mask
         if pawn_position == altered_check_mask:
             altered_check_mask ^= ep_map
         while attack_positions:
             pos_map = attack_positions & -attack_positions
             attack_positions &= attack_positions - 1
             # check if taking pawn is pinned
-            pin_mask = self.pin_masks[bitboard.get_single_position(pos_map)]
+            pin_mask = legality.get_pin_mask(bitboard.get_single_position(pos_map))
 
             # check if taken pawn is pinned
             self.board.all ^= pos_map
@@ -522,47 +649,286 @@ class Generator:
                 continue
 
             pos = bitboard.get_single_position(pos_map)
-            result.extend(map_to_moves(pos, ep_map, move.Flags.en_passent))
+            result.extend(map_to_moves(pos, ep_map, move.flag_en_passent))
 
         return result
 
-    def get_legal_king_moves(self):
-        # position = next(iter(self.board.int_positions[self.board.colour][pieces.king]))
-        position = bitboard.get_single_position(self.board.positions[self.board.colour][pieces.king])
-        pseudo_legal = king_pseudo_lookup[position]
-        legal_moves = pseudo_legal & ~self.attack_map & self.not_team_map
+    def get_legal_king_moves(self, legality, targets):
+        position = legality.king_pos
+        pseudo_legal = king_pseudo_lookup[position] & targets
+        if not pseudo_legal:
+            return []
+        legal_moves = pseudo_legal & (bitboard.full_map ^ legality.attack_map)
         return map_to_moves(position, legal_moves)
 
-    def get_legal_moves(self, only_captures=False) -> list[move.Move, ...]:
+    def get_capture_moves(self, legality) -> list[int, ...]:
         """
-        returns a list of legal moves from the current position
+        returns the legal captures, en passents and promotions (including quiet promotions)
         """
-        moves: list[move.Move, ...] = []
-
-        if not self.board.positions[self.board.colour][pieces.king]:
-            return moves
-        self.attack_map = self.get_attack_map()
+        moves: list[int, ...] = []
+        targets = self.board.team_maps[not self.board.colour]
+
+        moves.extend(self.get_legal_pawn_moves(legality, targets))
+        moves.extend(self.get_legal_knight_moves(legality, targets))
+        moves.extend(self.get_legal_bishop_moves(legality, targets))
+        moves.extend(self.get_legal_rook_moves(legality, targets))
+        moves.extend(self.get_legal_queen_moves(legality, targets))
+        moves.extend(self.get_legal_king_moves(legality, targets))
+        moves.extend(self.get_en_passent_moves(legality))
+
+        # promotions are worth searching early even if they don't capture anything
+        moves.extend(self.get_promotion_moves(legality, bitboard.full_map ^ self.board.team_maps[self.board.colour]))
+        return moves
 
-        king_pos = bitboard.get_single_position(self.board.positions[self.board.colour][pieces.king])
+    def get_quiet_moves(self, legality) -> list[int, ...]:
+        """
+        returns every legal move not returned by get_capture_moves
+        """
+        moves: list[int, ...] = []
+        targets = bitboard.full_map ^ self.board.all
+
+        moves.extend(self.get_legal_pawn_moves(legality, targets))
+        moves.extend(self.get_legal_knight_moves(legality, targets))
+        moves.extend(self.get_legal_bishop_moves(legality, targets))
+        moves.extend(self.get_legal_rook_moves(legality, targets))
+        moves.extend(self.get_legal_queen_moves(legality, targets))
+        moves.extend(self.get_legal_king_moves(legality, targets))
+        moves.extend(self.get_castling_moves(legality))
+        return moves
 
-        self.check_mask = self.get_check_mask()
+    def is_legal_quiet(self, p_move: int, legality) -> bool:
+        """
+        whether a packed move would be returned by get_quiet_moves, without generating them all
+        used to check killer moves, which were found in other positions
+        """
+        squares = self.board.squares
+        start, end = move.get_start(p_move), move.get_end(p_move)
+        piece = squares[start]
+        # must move one of our pieces onto an empty square
+        if piece is None or piece // 6 != self.board.colour or squares[end] is not None:
+            return False
+        piece_type = piece % 6
+        flag = move.get_flag(p_move)
+
+        if flag == move.flag_castle:
+            return piece_type == pieces.king and p_move in self.get_castling_moves(legality)
+        if flag != move.flag_none:
+            return False
+
+        end_map = bitboard.bitset[end]
+        if piece_type == pieces.king:
+            return bool(king_pseudo_lookup[start] & (bitboard.full_map ^ legality.attack_map) & end_map)
+        if piece_type == pieces.pawn and bitboard.bitset[start] & pawn_end_rows[self.board.colour]:
+            return False
+        pseudo_moves = self.pseudo_methods[piece_type](start)
+        return bool(pseudo_moves & legality.check_mask & legality.get_pin_mask(start) & end_map)
+
+    def get_legal_moves(self, only_captures=False) -> list[int, ...]:
+        """
+        returns a list of legal packed moves (see engine.move) from the current position
+        """
+        moves: list[int, ...] = []
 
-        self.pin_masks = self.get_pin_masks(king_pos)
+        if not self.board.positions[self.board.colour][pieces.king]:
+            return moves
+        legality = self.get_legality()
 
-        self.not_team_map = ~self.board.team_maps[self.board.colour]
+        targets = bitboard.full_map ^ self.board.team_maps[self.board.colour]
 
         if only_captures:
-            self.not_team_map = self.board.team_maps[not self.board.colour]
+            targets = self.board.team_maps[not self.board.colour]
 
-        moves.extend(self.get_legal_pawn_moves())
-        moves.extend(self.get_legal_knight_moves())
-        moves.extend(self.get_legal_bishop_moves())
-        moves.extend(self.get_legal_rook_moves())
-        moves.extend(self.get_legal_queen_moves())
-        moves.extend(self.get_legal_king_moves())
+        moves.extend(self.get_legal_pawn_moves(legality, targets))
+        moves.extend(self.get_legal_knight_moves(legality, targets))
+        moves.extend(self.get_legal_bishop_moves(legality, targets))
+        moves.extend(self.get_legal_rook_moves(legality, targets))
+        moves.extend(self.get_legal_queen_moves(legality, targets))
+        moves.extend(self.get_legal_king_moves(legality, targets))
 
         # special cases
-        moves.extend(self.get_castling_moves())
-        moves.extend(self.get_promotion_moves())
-        moves.extend(self.get_en_passent_moves())
+        moves.extend(self.get_castling_moves(legality))
+        moves.extend(self.get_promotion_moves(legality, targets))
+        moves.extend(self.get_en_passent_moves(legality))
+        return moves
+
+    def count_legal_moves(self) -> int:
+        """
+        returns len(self.get_legal_moves()), but counts the bits in each piece's legal positions instead of making moves
+        used for the last ply of perft
+        """
+        board = self.board
+        colour = board.colour
+        team = board.positions[colour]
+        if not team[pieces.king]:
+            return 0
+        legality = self.get_legality()
+        check_mask = legality.check_mask
+        pinned_map = legality.pinned_map
+        targets = bitboard.full_map ^ board.team_maps[colour]
+        mask = check_mask & targets
+        empty = bitboard.full_map ^ board.all
+        enemy_map = board.team_maps[not colour]
+        count = 0
+
+        end_row = pawn_end_rows[colour]
+        pawns = team[pieces.pawn] & (bitboard.full_map ^ end_row)
+        # pawns that aren't pinned all move the same way, so they can be counted together
+        free_pawns = pawns & (bitboard.full_map ^ pinned_map)
+        if colour == pieces.white:
+            single_steps = free_pawns << 8 & empty
+            double_steps = (single_steps & pawn_double_step_rows[colour]) << 8 & empty
+            left_attacks = (free_pawns & not_a_file_map) << 9 & enemy_map
+            right_attacks = (free_pawns & not_h_file_map) << 7 & enemy_map
+        else:
+            single_steps = free_pawns >> 8 & empty
+            double_steps = (single_steps & pawn_double_step_rows[colour]) >> 8 & empty
+            left_attacks = (free_pawns & not_a_file_map) >> 7 & enemy_map
+            right_attacks = (free_pawns & not_h_file_map) >> 9 & enemy_map
+        count += (single_steps & check_mask).bit_count() + (double_steps & check_mask).bit_count()
+        count += (left_attacks & check_mask).bit_count() + (right_attacks & check_mask).bit_count()
+
+        for position in bitboard.iter_bitmap(pawns & pinned_map):
+            count += (self.pseudo_pawn(position) & mask & legality.get_pin_mask(position)).bit_count()
+
+        # every promotion position is one move per piece it can promote to
+        for position in bitboard.iter_bitmap(team[pieces.pawn] & end_row):
+            legal_moves = self.pseudo_pawn(position) & mask & legality.get_pin_mask(position)
+            count += legal_moves.bit_count() * len(promotion_pieces)
+
+        for piece_type in (pieces.knight, pieces.bishop, pieces.rook, pieces.queen):
+            pseudo_method = self.pseudo_methods[piece_type]
+            for position in bitboard.iter_bitmap(team[piece_type]):
+                legal_moves = pseudo_method(position) & mask
+                if pinned_map & bitboard.bitset[position]:
+                    legal_moves &= legality.get_pin_mask(position)
+                count += legal_moves.bit_count()
+
+        king_targets = targets & (bitboard.full_map ^ legality.attack_map)
+        count += (king_pseudo_lookup[legality.king_pos] & king_targets).bit_count()
+
+        # special cases, which are rare enough to just generate
+        count += len(self.get_castling_moves(legality))
+        count += len(self.get_en_passent_moves(legality))
+        return count
+
+    def get_tactical_moves(self) -> list[int, ...]:
+        """
+        returns the legal captures and queen promotions from the current position, for quiescence search
+        cheaper than get_legal_moves(only_captures=True): there is no attack map or castling,
+        and every piece only looks at the squares it could capture on
+        """
+        moves: list[int, ...] = []
+        board = self.board
+        colour = board.colour
+        team = board.positions[colour]
+        if not team[pieces.king]:
+            return moves
+        enemy_map = board.team_maps[not colour]
+        legality = self.get_legality()
+
+        # in check only the checking piece can be taken (or anything, by the king)
+        # and in double check, only the king can move at all
+        if enemy_map & legality.check_mask:
+            moves.extend(self.get_legal_pawn_moves(legality, enemy_map))
+            # promotions are worth searching even without a capture, but only to a queen
+            targets = bitboard.full_map ^ board.team_maps[colour]
+            moves.extend(self.get_promotion_moves(legality, targets, (pieces.queen,)))
+            moves.extend(self.get_legal_knight_moves(legality, enemy_map))
+            moves.extend(self.get_legal_bishop_moves(legality, enemy_map))
+            moves.extend(self.get_legal_rook_moves(legality, enemy_map))
+            moves.extend(self.get_legal_queen_moves(legality, enemy_map))
+            moves.extend(self.get_en_passent_moves(legality))
+
+        # the king can't take a defended piece, and sliders see through where it used to be
+        king_pos = legality.king_pos
+        occupancy = board.all ^ team[pieces.king]
+        for position in bitboard.iter_bitmap(king_pseudo_lookup[king_pos] & enemy_map):
+            if not self.is_attacked(position, occupancy):
+                moves.append(move.encode(king_pos, position))
+
         return moves
+
+
+class Legality:
+    def __init__(self, generator: Generator):
+        """
+        what a position needs to tell which of its pseudo legal moves are legal, worked out as it is needed
+        each position gets its own, so searching other positions in between can't change it
+        NOTE the attack map is only made the first time it is used, so the board must be at this position then
+        """
+        board = generator.board
+        self.generator = generator
+        self.king_pos = bitboard.get_single_position(board.positions[board.colour][pieces.king])
+        # the positions that stop a check, or all 1s when not in check
+        self.check_mask = generator.get_check_mask()
+
+        # (position, ray) pairs, see Generator.get_pins
+        self.pins = generator.get_pins(self.king_pos)
+        self.pinned_map = 0
+        for position, _ in self.pins:
+            self.pinned_map |= bitboard.bitset[position]
+
+        if bitboard.CHECK_RANGES:
+            bitboard.check_ranges(self.check_mask, self.pinned_map, *(ray for _, ray in self.pins))
+
+        self._attack_map = None
+
+    @property
+    def attack_map(self):
+        """
+        every position the opposition attacks, see Generator.get_attack_map
+        only king moves and castling need it
+        """
+        if self._attack_map is None:
+            self._attack_map = self.generator.get_attack_map()
+            if bitboard.CHECK_RANGES:
+                bitboard.check_ranges(self._attack_map)
+        return self._attack_map
+
+    def get_pin_mask(self, position):
+        """
+        the positions a piece can move to without exposing the king
+        """
+        if self.pinned_map & bitboard.bitset[position]:
+            for pinned_position, ray in self.pins:
+                if pinned_position == position:
+                    return ray
+        return bitboard.full_map
+
+
+class CheckInfo:
+    def __init__(self, generator: Generator):
+        """
+        what a position needs to tell which of its moves give check, see Generator.gives_check
+        like Legality, each position gets its own
+        """
+        board = generator.board
+        self.king_pos = bitboard.get_single_position(board.positions[not board.colour][pieces.king])
+
+        rook_checks = rook_attacks(self.king_pos, board.all)
+        bishop_checks = bishop_attacks(self.king_pos, board.all)
+        # the positions each piece type gives check from, indexed by piece type
+        self.check_squares = [pawn_attack_lookups[not board.colour][self.king_pos],
+                              knight_pseudo_lookup[self.king_pos],
+                              bishop_checks,
+                              rook_checks,
+                              rook_checks | bishop_checks,
+                              0]
+
+        # (position, ray) pairs, see Generator.get_discoverers
+        self.discoverers = generator.get_discoverers(self.king_pos)
+        self.discoverer_map = 0
+        for position, _ in self.discoverers:
+            self.discoverer_map |= bitboard.bitset[position]
+
+        if bitboard.CHECK_RANGES:
+            bitboard.check_ranges(*self.check_squares, *(ray for _, ray in self.discoverers))
+
+    def get_ray(self, position):
+        """
+        the positions a discoverer can move to without uncovering the check
+        """
+        for discoverer_position, ray in self.discoverers:
+            if discoverer_position == position:
+                return ray
+        return 0
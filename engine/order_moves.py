@@ -1,47 +1,313 @@
 from engine.evaluate import piece_worths, piece_square
-from engine.bitboard import Board, get_single_position
-from engine.move import Move, Flags
+from engine.bitboard import Board
+from engine.move_generator import Generator
+from engine import move as move_
+from engine.pieces import pawn, king
 from engine.transposition import TranspositionTable
 
+from typing import Optional
 
-# gives an estimated value of how good a move is
-def estimate_value(board: Board, move: Move, best_move):
-    score = 0
-    start_piece_value, end_piece_value = None, None
+# the deepest ply that killer moves are stored for
+MAX_PLY = 128
+# ordering bonuses for quiet moves that caused cutoffs elsewhere in the tree
+#                first  second killer
+KILLER_BONUSES = (600, 550)
+COUNTERMOVE_BONUS = 500
+# history scores are halved whenever one of them reaches this
+HISTORY_LIMIT = 400
+# the transposition table's best move is always searched first
+BEST_MOVE_SCORE = 1 << 20
+# captures and promotions are searched before every quiet move
+CAPTURE_SCORE = 1 << 16
+# moves are packed into the low bits of their sort key, below the score
+score_shift = 17
+move_mask = (1 << score_shift) - 1
+# the start and end positions of a packed move
+start_end_mask = (1 << move_.flag_shift) - 1
 
-    for piece, pos_map in enumerate(board.positions[board.colour]):
-        if move.start & pos_map:
-            start_piece_value = piece
-            break
-    for piece, pos_map in enumerate(board.positions[not board.colour]):
-        if move.start & pos_map:
-            end_piece_value = piece
-            break
+# most valuable victim, least valuable attacker, indexed by [victim type][attacker type]
+mvv_lva_scores = [[10 * piece_worths[victim] - piece_worths[attacker] for attacker in range(6)] for victim in range(6)]
+
+
+def create_quiet_scores():
+    """
+    creates a table of how much a quiet move changes the piece square value of the moving piece
+    indexed by [coloured piece value][start + end * 64] (the low 12 bits of a packed move)
+    """
+    table = []
+    for colour in range(2):
+        for piece in range(6):
+            squares = piece_square[colour][piece]
+            table.append([squares[index >> 6] - squares[index & 63] for index in range(64 * 64)])
+    return table
+
+
+quiet_scores = create_quiet_scores()
+
+
+class MoveHistory:
+    def __init__(self):
+        """
+        stores the quiet moves that caused beta cutoffs during a search
+        so that similar moves can be ordered earlier
+        """
+        # the last two cutoff moves at each ply
+        self.killers = [[move_.no_move, move_.no_move] for _ in range(MAX_PLY)]
+        # butterfly table of cutoff scores, indexed by [colour][start][end]
+        self.history = [[[0 for _ in range(64)] for _ in range(64)] for _ in range(2)]
+        # the move that refuted the previous move, indexed by the previous move's [start][end]
+        self.countermoves = [[move_.no_move for _ in range(64)] for _ in range(64)]
+
+    def update(self, colour, move, depth, ply, previous_move):
+        """
+        records a quiet move that caused a beta cutoff
+        """
+        start, end = move_.get_start(move), move_.get_end(move)
+
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+
+        # deeper cutoffs save more work, so they are worth more
+        self.history[colour][start][end] += depth * depth
+        if self.history[colour][start][end] >= HISTORY_LIMIT:
+            self.age_history()
 
-    # if we take a piece, get the worth of that piece - worth of taking piece
-    if end_piece_value is not None:
-        score += piece_worths[end_piece_value] - piece_worths[start_piece_value] / 10
+        if previous_move != move_.no_move:
+            self.countermoves[move_.get_start(previous_move)][move_.get_end(previous_move)] = move
 
-    # if the move is a promotion
-    if move.flag == Flags.promotion:
-        score += piece_worths[move.promotion_piece]
+    def age_history(self):
+        """
+        halves every history score, so that old cutoffs count for less than new ones
+        """
+        for colour_table in self.history:
+            for start_table in colour_table:
+                for end in range(64):
+                    start_table[end] >>= 1
 
-    score -= piece_square[board.colour][start_piece_value][get_single_position(move.start)]
-    score += piece_square[board.colour][start_piece_value][get_single_position(move.end)]
+    def age(self):
+        """
+        called between searches
+        killers are only relevant to the ply they were found at, so they are cleared
+        """
+        for killers in self.killers:
+            killers[0] = killers[1] = move_.no_move
+        self.age_history()
 
+    def score(self, colour, move, ply, previous_move):
+        """
+        the ordering bonus for a quiet move
+        """
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if move == killers[0]:
+                return KILLER_BONUSES[0]
+            if move == killers[1]:
+                return KILLER_BONUSES[1]
+        if previous_move != move_.no_move and \
+                move == self.countermoves[move_.get_start(previous_move)][move_.get_end(previous_move)]:
+            return COUNTERMOVE_BONUS
+        return self.history[colour][move_.get_start(move)][move_.get_end(move)]
+
+
+# gives an estimated value of how good a move is
+def estimate_value(board: Board, move: int, best_move: int, history: Optional[MoveHistory] = None, ply=0,
+                   previous_move=move_.no_move):
     if move == best_move:
-        score += 10000
+        return BEST_MOVE_SCORE
+
+    # the coloured piece value of the moving piece and the piece being taken
+    piece = board.squares[move & move_.square_mask]
+    victim = board.squares[move >> move_.end_shift & move_.square_mask]
+    flag = move >> move_.flag_shift & move_.flag_mask
+
+    if victim is not None:
+        score = CAPTURE_SCORE + mvv_lva_scores[victim % 6][piece % 6]
+    elif flag == move_.flag_en_passent:
+        score = CAPTURE_SCORE + mvv_lva_scores[pawn][pawn]
+    else:
+        score = quiet_scores[piece][move & start_end_mask]
+        if history is not None and flag != move_.flag_promotion:
+            score += history.score(board.colour, move, ply, previous_move)
+
+    if flag == move_.flag_promotion:
+        score += CAPTURE_SCORE + piece_worths[move >> move_.promotion_shift]
 
     return score
 
 
-def order(board: Board, moves: list[Move], table: TranspositionTable):
+def is_quiet(board: Board, move: int):
+    """
+    whether a move neither takes a piece nor promotes
+    """
+    flag = move_.get_flag(move)
+    return board.squares[move_.get_end(move)] is None and (flag == move_.flag_none or flag == move_.flag_castle)
+
+
+def get_captured_type(board: Board, move: int):
+    """
+    returns the piece type a move takes, or None if it doesn't take anything
+    """
+    if move_.get_flag(move) == move_.flag_en_passent:
+        return pawn
+    captured = board.squares[move_.get_end(move)]
+    if captured is None:
+        return None
+    return captured % 6
+
+
+def see(board: Board, generator: Generator, move: int) -> int:
     """
-    roughly orders a list of moves in a given board.
+    static exchange evaluation
+    returns the material the side to move gains from a move after every capture back and forth on its end position,
+    with each side taking with its least valuable piece first and able to stop whenever carrying on would lose more
+    pins and checks are ignored
+    """
+    start, end = move_.get_start(move), move_.get_end(move)
+    flag = move_.get_flag(move)
+    positions = board.positions
+    occupancy = board.all ^ 1 << start
+
+    if flag == move_.flag_en_passent:
+        gain = piece_worths[pawn]
+        # the taken pawn is next to the end position, in the row the pawn started on
+        occupancy ^= 1 << (start // 8 * 8 + end % 8)
+    else:
+        victim = board.squares[end]
+        gain = 0 if victim is None else piece_worths[victim % 6]
+    # the value of the piece that now stands on the end position
+    on_square = piece_worths[board.squares[start] % 6]
+    if flag == move_.flag_promotion:
+        promotion_worth = piece_worths[move_.get_promotion_piece(move)]
+        gain += promotion_worth - on_square
+        on_square = promotion_worth
+
+    # gains[i] is the material the side making the i-th capture has won if the exchange stops there
+    gains = [gain]
+    colour = not board.colour
+    attackers = generator.attackers_to(end, occupancy) & occupancy
+    while True:
+        team_attackers = attackers & board.team_maps[colour]
+        if not team_attackers:
+            break
+        # least valuable attacker
+        for piece_type in range(6):
+            piece_map = team_attackers & positions[colour][piece_type]
+            if piece_map:
+                break
+        occupancy ^= piece_map & -piece_map
+        # moving the piece may uncover a slider behind it
+        attackers = generator.attackers_to(end, occupancy) & occupancy
+        # the king can only take if nothing can take it back
+        if piece_type == king and attackers & board.team_maps[not colour]:
+            break
+
+        gains.append(on_square - gains[-1])
+        on_square = piece_worths[piece_type]
+        colour = not colour
+
+    # either side can stop capturing, so each gain is at least as good as letting the other side continue
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = min(gains[i - 1], -gains[i])
+    return gains[0]
+
+
+def is_losing_capture(board: Board, generator: Generator, move: int) -> bool:
+    """
+    whether a capture or promotion loses material, by static exchange evaluation
+    taking something worth at least as much as the moving piece can never lose, so it skips the exchange
+    """
+    victim = board.squares[move_.get_end(move)]
+    if move_.get_flag(move) != move_.flag_promotion and \
+            (victim is None or piece_worths[victim % 6] >= piece_worths[board.squares[move_.get_start(move)] % 6]):
+        return False
+    return see(board, generator, move) < 0
+
+
+def order(board: Board, moves: list[int], table: TranspositionTable, history: Optional[MoveHistory] = None, ply=0,
+          previous_move=move_.no_move):
+    """
+    roughly orders a list of moves in a given board, in place.
     better moves are placed first
+    :param history: killer, history and countermove tables to order quiet moves with
+    :param ply: how far the board is from the root of the search, used for killer moves
+    :param previous_move: the move that led to this board, used for countermoves
     """
-    best_move = table[board.zobrist].move
-    move_value_pairs = [(move, estimate_value(board, move, best_move)) for move in moves]
-    move_value_pairs = sorted(move_value_pairs, key=lambda pair: pair[1], reverse=True)
-    sorted_list = list(map(lambda pair: pair[0], move_value_pairs))
-    return sorted_list
+    return sort_moves(board, moves, table[board.zobrist].move, history, ply, previous_move)
+
+
+def sort_moves(board: Board, moves: list[int], best_move: int, history: Optional[MoveHistory] = None, ply=0,
+               previous_move=move_.no_move):
+    """
+    the same as order, but with the best move given directly instead of looked up in a table
+    """
+    # sort keys are the score with the move packed in below it, so a plain int sort orders them
+    for i, move in enumerate(moves):
+        moves[i] = estimate_value(board, move, best_move, history, ply, previous_move) << score_shift | move
+    moves.sort(reverse=True)
+    for i, key in enumerate(moves):
+        moves[i] = key & move_mask
+    return moves
+
+
+class MovePicker:
+    def __init__(self, board: Board, generator: Generator, best_move=move_.no_move,
+                 history: Optional[MoveHistory] = None, ply=0, previous_move=move_.no_move):
+        """
+        iterates over the legal moves of a position in stages, only generating each stage once the last runs out:
+            the best move (from the transposition table),
+            captures and promotions that don't lose material, by MVV-LVA
+            killer moves
+            every other quiet move, by history
+            captures that lose material, by static exchange evaluation
+        so a beta cutoff early on skips generating most of the moves
+        NOTE the board must be back at this position whenever the next move is asked for
+        :param best_move: a move already found for this position (see TranspositionTable.get_move), or move.no_move
+        """
+        self.board = board
+        self.generator = generator
+        self.best_move = best_move
+        self.history = history
+        self.ply = ply
+        self.previous_move = previous_move
+
+    def __iter__(self):
+        board, generator, best_move = self.board, self.generator, self.best_move
+
+        # the best move was found in this same position (down to castle rights and en passent),
+        # so it is legal without generating anything
+        if best_move != move_.no_move:
+            yield best_move
+
+        legality = generator.get_legality()
+
+        captures = generator.get_capture_moves(legality)
+        sort_moves(board, captures, best_move)
+        losing_captures = []
+        for move in captures:
+            if move == best_move:
+                continue
+            if is_losing_capture(board, generator, move):
+                losing_captures.append(move)
+            else:
+                yield move
+
+        searched_killers = []
+        if self.history is not None and self.ply < MAX_PLY:
+            for killer in self.history.killers[self.ply]:
+                if killer == move_.no_move or killer == best_move or killer in searched_killers:
+                    continue
+                if generator.is_legal_quiet(killer, legality):
+                    searched_killers.append(killer)
+                    yield killer
+
+        quiets = generator.get_quiet_moves(legality)
+        sort_moves(board, quiets, best_move, self.history, self.ply, self.previous_move)
+        for move in quiets:
+            if move != best_move and move not in searched_killers:
+                yield move
+
+        losing_captures.sort(key=lambda capture: see(board, generator, capture), reverse=True)
+        yield from losing_captures
@@ -1,49 +1,373 @@
+"""
+perft walks every legal move to a fixed depth and counts the positions at the end
+the counts are known for lots of positions, so it is the quickest way to check the move generator is still right
+and how fast it is
+
+    python -m engine.perft                                  run the standard suite up to depth 4
+    python -m engine.perft --depth 5                        run the standard suite up to depth 5
+    python -m engine.perft "<fen>" --depth 4 --divide       count one position, with each root move's count
+    python -m engine.perft "<fen> ;D1 20 ;D2 400"           EPD lines are checked against their counts
+    python -m engine.perft --epd positions.epd              check every line of an EPD file
+
+    python -m engine.perft --depth 6 --hash 4000000         remember counts of repeated positions in a table
+    python -m engine.perft --depth 6 --processes 0          split the work between a process for each cpu
+
+results are printed as JSON, and the exit code is 1 if any count was wrong
+"""
+import argparse
+import json
+import multiprocessing
+import sys
 import time
-import bitboard
-import move_generator
+from array import array
+
+from engine import bitboard
+from engine import move_generator
+from engine.move import notate
+
+# the deepest the standard suite goes by default
+default_suite_depth = 4
+# the depth used for a position without any known counts
+default_depth = 4
+
+# name, fen, known node counts for depth 1, 2, ...
+standard_positions = [
+    ("start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+    # en passent and castling edge cases
+    ("illegal ep move 1", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", [18, 92, 1670, 10138]),
+    ("illegal ep move 2", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", [13, 102, 1266, 10276]),
+    ("ep capture checks opponent", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", [15, 126, 1928, 13931]),
+    ("short castling gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1", [15, 66, 1198, 6399]),
+    ("long castling gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1", [16, 71, 1286, 7418]),
+    ("castle rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1", [26, 1141, 27826]),
+    ("castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1", [44, 1494, 50509]),
+    ("promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1", [11, 133, 1442, 19174]),
+    ("discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1", [29, 165, 5160, 31961]),
+    ("promote to give check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1", [9, 40, 472, 2661]),
+    ("under promote to give check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1", [6, 27, 273, 1329]),
+    ("self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1", [2, 6, 13, 63]),
+    ("stalemate and checkmate 1", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1", [10, 25, 268, 926]),
+    ("stalemate and checkmate 2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", [37, 183, 6559, 23527]),
+]
+
+
+class PerftTable:
+    def __init__(self, size):
+        """
+        remembers the perft count of positions, so a position reached by different move orders is only counted once
+        stored in flat arrays indexed by zobrist % size, where a new count always replaces the old one
+        """
+        self.size = size
+        self.keys = array("Q", bytes(8 * size))
+        # -1 when empty
+        self.depths = array("b", [-1]) * size
+        self.counts = array("Q", bytes(8 * size))
+
+        self.probes = 0
+        self.hits = 0
+
+    def get(self, board: bitboard.Board, depth):
+        """
+        returns the stored count of the board at depth, or None if it isn't stored
+        """
+        self.probes += 1
+        index = board.zobrist % self.size
+        if self.keys[index] == board.zobrist and self.depths[index] == depth:
+            self.hits += 1
+            return self.counts[index]
+        return None
+
+    def put(self, board: bitboard.Board, depth, count):
+        index = board.zobrist % self.size
+        self.keys[index] = board.zobrist
+        self.depths[index] = depth
+        self.counts[index] = count
 
+    def get_stats(self):
+        return get_hash_stats(self.size, self.probes, self.hits)
 
 
-#fen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
-#fen = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - -"
-#fen = "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - -"
-fen = "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1"
+def get_hash_stats(size, probes, hits):
+    return {
+        "size": size,
+        "probes": probes,
+        "hits": hits,
+        "hit_rate": round(hits / probes, 4) if probes else None,
+    }
 
-board = bitboard.Board.from_fen(fen)
-generator = move_generator.Generator(board)
 
+def perft(board: bitboard.Board, generator: move_generator.Generator, depth: int, table: PerftTable = None) -> int:
+    """
+    returns the number of positions depth moves after the board
+    :param table: a PerftTable to look up and store the counts of positions in, or None
+    """
+    if depth == 0:
+        return 1
+
+    if table is not None:
+        node_count = table.get(board, depth)
+        if node_count is not None:
+            return node_count
+
+    # the last ply only needs counting, which is much faster than making the moves
+    if depth == 1:
+        node_count = generator.count_legal_moves()
+        if table is not None:
+            table.put(board, depth, node_count)
+        return node_count
 
-def perft(search_depth, print_moves=True):
-    move_list = generator.get_legal_moves()
-    n_moves = len(move_list)
     node_count = 0
+    for move in generator.get_legal_moves():
+        board.make_move(move)
+        node_count += perft(board, generator, depth - 1, table)
+        board.unmake_move()
+
+    if table is not None:
+        table.put(board, depth, node_count)
 
-    if search_depth == 1:
-        return n_moves
+    return node_count
 
-    for move in move_list:
+
+def divide(board: bitboard.Board, generator: move_generator.Generator, depth: int,
+           table: PerftTable = None) -> dict[str, int]:
+    """
+    returns the perft count after each root move, notated
+    comparing these with another engine's finds which move is generated wrong
+    """
+    counts = {}
+    for move in generator.get_legal_moves():
         board.make_move(move)
-        count = perft(search_depth - 1, print_moves=False)
-        node_count += count
+        counts[notate(move)] = perft(board, generator, depth - 1, table)
+        board.unmake_move()
+    return counts
+
+
+# each worker process keeps its own table between tasks, see init_worker
+worker_table = None
+
 
-        if print_moves:
-            print(f"{move.notate()}: {count}")
+def init_worker(hash_size):
+    global worker_table
+    worker_table = PerftTable(hash_size) if hash_size else None
 
+
+def count_task(task):
+    """
+    counts one subtree in a worker process
+    the board is rebuilt from the fen and the moves leading to the subtree are replayed on it
+    :param task: (root move index, fen, packed moves to make, depth left)
+    :return: (root move index, count, table probes, table hits)
+    """
+    index, fen, moves, depth = task
+    board = bitboard.Board.from_fen(fen)
+    generator = move_generator.Generator(board)
+    for move in moves:
+        board.make_move(move)
+
+    probes, hits = (worker_table.probes, worker_table.hits) if worker_table is not None else (0, 0)
+    count = perft(board, generator, depth, worker_table)
+    if worker_table is not None:
+        probes, hits = worker_table.probes - probes, worker_table.hits - hits
+    return index, count, probes, hits
+
+
+def parallel_divide(fen: str, depth: int, processes=None, split_depth=2, hash_size=0):
+    """
+    the same as divide, but the subtrees are counted by a pool of processes
+    splitting after two plies gives many more, smaller tasks than one per root move,
+    and they are handed out as workers become free, so one big root move doesn't leave the rest waiting
+    :param processes: how many worker processes to use, None for one per cpu
+    :param split_depth: 1 to give each root move its own task, 2 to give each reply to a root move its own task
+    :param hash_size: the size of each worker's PerftTable, or 0 to not use one
+    :return: the divide counts, and the table stats (or None)
+    """
+    board = bitboard.Board.from_fen(fen)
+    generator = move_generator.Generator(board)
+    root_moves = generator.get_legal_moves()
+
+    tasks = []
+    for index, root_move in enumerate(root_moves):
+        if split_depth == 1 or depth <= 2:
+            tasks.append((index, fen, (root_move,), depth - 1))
+            continue
+        board.make_move(root_move)
+        for reply in generator.get_legal_moves():
+            tasks.append((index, fen, (root_move, reply), depth - 2))
         board.unmake_move()
 
-    return node_count
+    root_counts = [0] * len(root_moves)
+    probes, hits = 0, 0
+    pool = multiprocessing.Pool(processes, initializer=init_worker, initargs=(hash_size,))
+    try:
+        # imap_unordered hands out one task at a time, to whichever worker is free
+        for index, count, task_probes, task_hits in pool.imap_unordered(count_task, tasks):
+            root_counts[index] += count
+            probes += task_probes
+            hits += task_hits
+    finally:
+        # let the workers finish on their own, rather than terminating them
+        pool.close()
+        pool.join()
+
+    counts = {notate(root_move): count for root_move, count in zip(root_moves, root_counts)}
+    stats = get_hash_stats(hash_size, probes, hits) if hash_size else None
+    return counts, stats
+
+
+def parse_epd(line: str):
+    """
+    splits a line like "<fen> ;D1 20 ;D2 400" into a fen and a dictionary of the known counts at each depth
+    the fen can leave out the half and full move counts
+    """
+    fields = line.strip().split(";")
+    fen_fields = fields[0].split()
+    if len(fen_fields) == 4:
+        fen_fields += ["0", "1"]
+    fen = " ".join(fen_fields)
+
+    known = {}
+    for operation in fields[1:]:
+        operation = operation.split()
+        if len(operation) == 2 and operation[0].upper().startswith("D"):
+            known[int(operation[0][1:])] = int(operation[1])
+    return fen, known
+
+
+def run_position(name: str, fen: str, depth: int, expected=None, show_divide=False, hash_size=0, processes=1,
+                 split_depth=2) -> dict:
+    """
+    runs perft on one position and returns a JSON friendly summary of it
+    :param expected: the known count at this depth, if there is one
+    :param hash_size: how many entries the PerftTable has, or 0 to not use one
+    :param processes: how many processes to split the work between, None for one per cpu (see parallel_divide)
+    """
+    start = time.perf_counter()
+    if processes != 1 and depth > 1:
+        counts, hash_stats = parallel_divide(fen, depth, processes, split_depth, hash_size)
+        nodes = sum(counts.values())
+    else:
+        board = bitboard.Board.from_fen(fen)
+        generator = move_generator.Generator(board)
+        table = PerftTable(hash_size) if hash_size else None
+        if show_divide:
+            counts = divide(board, generator, depth, table)
+            nodes = sum(counts.values())
+        else:
+            counts = None
+            nodes = perft(board, generator, depth, table)
+        hash_stats = table.get_stats() if table is not None else None
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "name": name,
+        "fen": fen,
+        "depth": depth,
+        "nodes": nodes,
+        "seconds": round(elapsed, 3),
+        "nps": int(nodes / elapsed) if elapsed else None,
+    }
+    if expected is not None:
+        result["expected"] = expected
+        result["ok"] = nodes == expected
+    if hash_stats is not None:
+        result["hash"] = hash_stats
+    if show_divide:
+        result["divide"] = counts
+    return result
+
+
+def get_depth(known, max_depth):
+    """
+    the deepest depth with a known count that isn't deeper than max_depth (when given)
+    or max_depth / default_depth if there isn't one
+    """
+    depths = [depth for depth in known if max_depth is None or depth <= max_depth]
+    return max(depths) if depths else max_depth or default_depth
+
+
+def get_jobs(args):
+    """
+    returns (name, fen, depth, expected count or None) for every position the arguments ask for
+    """
+    jobs = []
+    if args.position is not None:
+        fen, known = parse_epd(args.position)
+        depth = get_depth(known, args.depth)
+        jobs.append(("position", fen, depth, known.get(depth)))
+
+    if args.epd is not None:
+        with open(args.epd, "r") as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip() or line.startswith("#"):
+                    continue
+                fen, known = parse_epd(line)
+                # check the deepest count we know, unless told to stop sooner
+                depth = get_depth(known, args.depth)
+                jobs.append((f"line {line_number}", fen, depth, known.get(depth)))
+
+    if args.suite or not jobs:
+        max_depth = args.depth or default_suite_depth
+        for name, fen, counts in standard_positions:
+            depth = min(max_depth, len(counts))
+            jobs.append((name, fen, depth, counts[depth - 1]))
+
+    return jobs
 
 
-print("searching")
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m engine.perft",
+                                     description="count the positions reachable from a board, to check and time "
+                                                 "the move generator")
+    parser.add_argument("position", nargs="?", help="a FEN or EPD line (;D<depth> <count> operations are checked)")
+    parser.add_argument("-d", "--depth", type=int, help="how many plies to search")
+    parser.add_argument("--divide", action="store_true", help="also give the count after each root move")
+    parser.add_argument("--epd", help="a file of EPD lines to check")
+    parser.add_argument("--hash", type=int, default=0, metavar="ENTRIES",
+                        help="size of the table of already counted positions (0, the default, turns it off "
+                             "so nodes per second measures the move generator)")
+    parser.add_argument("-p", "--processes", type=int, default=1,
+                        help="how many processes to count with (0 for one per cpu, 1, the default, for no pool)")
+    parser.add_argument("--split", type=int, choices=(1, 2), default=2,
+                        help="how many plies deep to split the work between processes")
+    parser.add_argument("--suite", action="store_true",
+                        help="run the standard positions (the default when no position is given)")
+    args = parser.parse_args(argv)
 
-t = time.perf_counter()
+    if args.depth is not None and args.depth < 1:
+        parser.error("depth must be at least 1")
+    if args.hash < 0:
+        parser.error("hash size can't be negative")
+    if args.processes < 0:
+        parser.error("processes can't be negative")
+    processes = args.processes or None
 
-depth = 4
-nodes = perft(depth)
+    results = []
+    for name, fen, depth, expected in get_jobs(args):
+        results.append(run_position(name, fen, depth, expected, args.divide, args.hash, processes, args.split))
 
-elapsed = time.perf_counter() - t
+    total_nodes = sum(result["nodes"] for result in results)
+    total_seconds = sum(result["seconds"] for result in results)
+    summary = {
+        "positions": results,
+        "nodes": total_nodes,
+        "seconds": round(total_seconds, 3),
+        "nps": int(total_nodes / total_seconds) if total_seconds else None,
+        "ok": all(result.get("ok", True) for result in results),
+    }
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["ok"] else 1
 
-print(f"finished in {elapsed:.2f}s")
-print(f"{int(nodes / elapsed):,} n/s")
 
-print(f"{nodes:,} nodes")
+if __name__ == "__main__":
+    sys.exit(main())
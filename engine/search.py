@@ -1,4 +1,5 @@
 from engine import bitboard
+from engine import move as move_
 from engine import move_generator
 from engine import evaluate
 from engine import tapered_eval
@@ -8,6 +9,7 @@ from engine import transposition
 
 from typing import Optional
 
+import math
 import time
 
 DEFAULT_DEPTH = 3
@@ -15,10 +17,55 @@ DEFAULT_TIME_LIMIT = 1  # s
 QUIESCENCE = True
 USE_TT = True
 DEFAULT_TT_SIZE = 1000000
+NULL_MOVE = True
+# how much shallower the search after a null move is
+NULL_MOVE_REDUCTION = 2
+# null moves are not tried closer to the leaves than this
+NULL_MOVE_MIN_DEPTH = 2
+# principal variation search
+PVS = True
+# late move reductions
+LMR = True
+# moves are not reduced closer to the leaves than this
+LMR_MIN_DEPTH = 3
+# the number of moves at the start of the ordered list that are never reduced
+LMR_FULL_DEPTH_MOVES = 3
+# reduction = LMR_BASE + log(depth) * log(move number) / LMR_DIVISOR
+LMR_BASE = 0.75
+LMR_DIVISOR = 2.25
+# futility pruning: quiet moves at depth 1 and 2 are skipped when the static eval plus a margin can't reach alpha
+FUTILITY = True
+#                   depth 0, 1,                                    2
+FUTILITY_MARGINS = (0, tapered_eval.mg_values[pieces.bishop], tapered_eval.mg_values[pieces.rook])
+# reverse futility (static null move) pruning: a node fails high when the static eval minus a margin still beats beta
+REVERSE_FUTILITY = True
+REVERSE_FUTILITY_MAX_DEPTH = 3
+# the margin is this multiplied by the depth
+REVERSE_FUTILITY_MARGIN = tapered_eval.mg_values[pieces.pawn]
+# delta pruning: captures in qsearch are skipped when winning the piece can't lift the eval to alpha
+DELTA_PRUNING = True
+DELTA_MARGIN = 2 * tapered_eval.mg_values[pieces.pawn]
+# captures in qsearch that lose material by static exchange evaluation are skipped
+SEE_PRUNING = True
+# order quiet moves with killer moves, the history heuristic and countermoves
+MOVE_HISTORY = True
 
 POSITIVE_INFINITY = 9999999
 NEGATIVE_INFINITY = -POSITIVE_INFINITY
 CHECKMATE_VALUE = -999999
+# scores further from 0 than this are mates, which pruning margins should not be applied to
+MATE_BOUND = -CHECKMATE_VALUE - 1000
+
+
+def create_reduction_table(base, divisor, size=64):
+    """
+    creates a table of late move reductions indexed by [depth][move number]
+    """
+    table = [[0 for _ in range(size)] for _ in range(size)]
+    for depth in range(1, size):
+        for move_number in range(1, size):
+            table[depth][move_number] = int(base + math.log(depth) * math.log(move_number) / divisor)
+    return table
 
 
 class Bot:
@@ -38,6 +85,33 @@ class Bot:
         self.eval_function = tapered_eval.evaluate
         self.tt = transposition.TranspositionTable(tt_size)
         self.tt_hits = 0
+        self.use_null_move = NULL_MOVE
+        self.null_move_reduction = NULL_MOVE_REDUCTION
+        self.null_move_min_depth = NULL_MOVE_MIN_DEPTH
+        self.null_move_cutoffs = 0
+        self.use_pvs = PVS
+        self.use_lmr = LMR
+        self.lmr_min_depth = LMR_MIN_DEPTH
+        self.lmr_full_depth_moves = LMR_FULL_DEPTH_MOVES
+        # replace this to change how much each move gets reduced by
+        self.lmr_reductions = create_reduction_table(LMR_BASE, LMR_DIVISOR)
+        self.re_searches = 0
+        self.use_futility = FUTILITY
+        self.futility_margins = FUTILITY_MARGINS
+        self.futility_prunes = 0
+        self.use_reverse_futility = REVERSE_FUTILITY
+        self.reverse_futility_max_depth = REVERSE_FUTILITY_MAX_DEPTH
+        self.reverse_futility_margin = REVERSE_FUTILITY_MARGIN
+        self.reverse_futility_prunes = 0
+        self.use_delta_pruning = DELTA_PRUNING
+        self.delta_margin = DELTA_MARGIN
+        self.delta_prunes = 0
+        self.use_see_pruning = SEE_PRUNING
+        self.see_prunes = 0
+        self.use_move_history = MOVE_HISTORY
+        self.move_history = order_moves.MoveHistory()
+        # the board's undo_count at the root of the search, used to work out the ply of a node
+        self.root_ply = 0
 
     def should_finish_search(self):
         """
@@ -58,6 +132,13 @@ class Bot:
 
         self.tt_hits = 0
         self.nodes = 0
+        self.null_move_cutoffs = 0
+        self.re_searches = 0
+        self.futility_prunes = 0
+        self.reverse_futility_prunes = 0
+        self.delta_prunes = 0
+        self.see_prunes = 0
+        self.move_history.age()
 
         # iterative deepening
         self.depth = 1
@@ -73,12 +154,19 @@ class Bot:
         print("depth:", self.depth)
         print("value:", self.best_root_score)
         print("tt hits:", self.tt_hits)
+        print("null move cutoffs:", self.null_move_cutoffs)
+        print("re-searches:", self.re_searches)
+        print("futility prunes:", self.futility_prunes)
+        print("reverse futility prunes:", self.reverse_futility_prunes)
+        print("delta prunes:", self.delta_prunes)
+        print("see prunes:", self.see_prunes)
         print("nodes:", self.nodes)
         return self.best_root_move
 
     def negamax_root(self, board, depth):
         moves_list = self.generator.get_legal_moves()
-        moves_list = order_moves.order(board, moves_list, self.tt)
+        self.root_ply = board.undo_count
+        moves_list = order_moves.order(board, moves_list, self.tt, self.get_move_history())
 
         self.nodes += len(moves_list)
 
@@ -101,7 +189,39 @@ class Bot:
         self.best_root_move = best_move
         self.best_root_score = best_score
 
-    def negamax(self, board, depth, alpha, beta):
+    def can_null_move(self, board, depth, beta, static_eval):
+        """
+        whether it is safe to try a null move search at this node
+        NOTE passing while in check would let the king be taken, so this must not be called in check
+        """
+        if depth < self.null_move_min_depth:
+            return False
+        # with only a king and pawns, zugzwang is common, so passing could be better than every real move
+        # game_phases only counts knights, bishops, rooks and queens
+        if not board.game_phases[board.colour]:
+            return False
+        # passing is only worth trying if we are already doing well enough
+        return static_eval >= beta
+
+    def get_move_history(self):
+        """
+        the killer, history and countermove tables to order with, or None if they are switched off
+        """
+        return self.move_history if self.use_move_history else None
+
+    def get_reduction(self, depth, move_number):
+        """
+        how many plies shallower a late quiet move should be searched
+        never reduces the search straight into quiescence
+        """
+        size = len(self.lmr_reductions) - 1
+        reduction = self.lmr_reductions[min(depth, size)][min(move_number, size)]
+        return max(min(reduction, depth - 2), 0)
+
+    def negamax(self, board, depth, alpha, beta, allow_null=True):
+        """
+        :param allow_null: False straight after a null move, so two are never made in a row
+        """
         if self.use_tt:
             if self.tt.contains(board.zobrist, depth, alpha, beta):
                 self.tt_hits += 1
@@ -113,24 +233,84 @@ class Bot:
             else:
                 return self.eval_function(board)
 
-        moves = self.generator.get_legal_moves()
-        if not moves:
-            # either a win, loss, or draw
-            if self.generator.check_mask == ~0:  # not in check
-                return 0
-            else:
-                return CHECKMATE_VALUE - depth
+        in_check = self.generator.is_in_check()
+        # none of the pruning below is safe in check, so the eval isn't needed
+        static_eval = None if in_check else self.eval_function(board)
 
-        moves = order_moves.order(board, moves, self.tt)
+        # reverse futility pruning
+        # if we are so far above beta that even losing a margin for each ply left won't bring us below it
+        if self.use_reverse_futility and not in_check and depth <= self.reverse_futility_max_depth \
+                and abs(beta) < MATE_BOUND and static_eval - self.reverse_futility_margin * depth >= beta:
+            self.reverse_futility_prunes += 1
+            return beta
+
+        # null move pruning
+        # if we pass the turn and the opponent still can't get the score below beta
+        # then a real move will (almost always) do at least as well
+        if self.use_null_move and allow_null and not in_check and self.can_null_move(board, depth, beta, static_eval):
+            board.make_null_move()
+            null_depth = max(depth - 1 - self.null_move_reduction, 0)
+            score = -self.negamax(board, null_depth, -beta, -beta + 1, allow_null=False)
+            board.unmake_null_move()
+
+            if self.should_finish_search():
+                return alpha
+
+            if score >= beta:
+                self.null_move_cutoffs += 1
+                return beta
+
+        can_reduce = self.use_lmr and depth >= self.lmr_min_depth and not in_check
+
+        # futility pruning
+        # if a quiet move can't lift the eval up to alpha, even with a margin, it isn't worth searching
+        futile = self.use_futility and not in_check and depth < len(self.futility_margins) \
+            and abs(alpha) < MATE_BOUND and static_eval + self.futility_margins[depth] <= alpha
+
+        ply = board.undo_count - self.root_ply
+        # a null move doesn't go into past_moves, so there is no previous move to counter straight after one
+        previous_move = board.past_moves[-1] if allow_null and board.past_moves else move_.no_move
+        # moves are generated lazily in stages, so a cutoff skips generating the rest
+        moves = order_moves.MovePicker(board, self.generator, self.tt.get_move(board.zobrist),
+                                       self.get_move_history(), ply, previous_move)
+
+        # moves that give check are never pruned or reduced
+        check_info = self.generator.get_check_info() if futile or can_reduce else None
 
         node_type = transposition.NodeType.upper_bound
 
         best_move = None
 
-        for move in moves:
+        move_number = -1
+        for move_number, move in enumerate(moves):
+            # the first move is always searched, so that we still have a best move
+            if futile and move_number and order_moves.is_quiet(board, move) \
+                    and not self.generator.gives_check(move, check_info):
+                self.futility_prunes += 1
+                continue
+
+            reduction = 0
+            if can_reduce and move_number >= self.lmr_full_depth_moves and order_moves.is_quiet(board, move) \
+                    and not self.generator.gives_check(move, check_info):
+                reduction = self.get_reduction(depth, move_number)
+
             self.nodes += 1
             board.make_move(move)
-            score = -self.negamax(board, depth - 1, -beta, -alpha)
+            if move_number == 0 or not self.use_pvs and not reduction:
+                score = -self.negamax(board, depth - 1, -beta, -alpha)
+            else:
+                # with principal variation search, every move after the first is expected to be worse
+                # so it is first searched with a zero window, which just proves that it can't beat alpha
+                window = -alpha - 1 if self.use_pvs else -beta
+                score = -self.negamax(board, depth - 1 - reduction, window, -alpha)
+                # a reduced move that beats alpha has to be searched to full depth
+                if reduction and score > alpha:
+                    self.re_searches += 1
+                    score = -self.negamax(board, depth - 1, window, -alpha)
+                # a move that beats alpha inside the zero window needs its real score
+                if self.use_pvs and alpha < score < beta:
+                    self.re_searches += 1
+                    score = -self.negamax(board, depth - 1, -beta, -alpha)
             board.unmake_move()
 
             if self.should_finish_search():
@@ -141,6 +321,9 @@ class Bot:
                 node_type = transposition.NodeType.lower_bound
                 best_move = move
                 alpha = beta
+                # remember quiet refutations so that they get searched early elsewhere
+                if self.use_move_history and order_moves.is_quiet(board, move):
+                    self.move_history.update(board.colour, move, depth, ply, previous_move)
                 break
             # if this is the new best move
             if score > alpha:
@@ -148,6 +331,13 @@ class Bot:
                 best_move = move
                 alpha = score
 
+        if move_number == -1:
+            # no legal moves, so either a win, loss, or draw
+            if not in_check:
+                return 0
+            else:
+                return CHECKMATE_VALUE - depth
+
         new_entry = transposition.TTEntry(board.zobrist, depth, best_move, alpha, node_type)
         self.tt.replace(new_entry)
 
@@ -167,13 +357,28 @@ class Bot:
         if current_eval > alpha:
             alpha = current_eval
 
-        # search only moves that are captures
-        moves = self.generator.get_legal_moves(only_captures=True)
+        # search only captures and promotions, most valuable victims first
+        moves = self.generator.get_tactical_moves()
+        moves = order_moves.order(board, moves, self.tt)
 
         best_move = None
         node_type = transposition.NodeType.lower_bound
 
         for move in moves:
+            # delta pruning
+            # if taking the piece (plus a margin) still leaves us below alpha, the capture can't help
+            if self.use_delta_pruning and move_.get_flag(move) != move_.flag_promotion:
+                captured = order_moves.get_captured_type(board, move)
+                gain = 0 if captured is None else tapered_eval.mg_values[captured]
+                if current_eval + gain + self.delta_margin <= alpha:
+                    self.delta_prunes += 1
+                    continue
+
+            # a capture that loses material once the opponent takes back is very unlikely to raise alpha
+            if self.use_see_pruning and order_moves.is_losing_capture(board, self.generator, move):
+                self.see_prunes += 1
+                continue
+
             self.nodes += 1
             board.make_move(move)
             score = -self.qsearch(board, depth-1, -beta, -alpha)
@@ -1,5 +1,4 @@
 from engine import pieces
-from engine import bitboard
 
 #             P  N     B   R      Q    K
 mg_values = [82, 337, 365, 477, 1025,  0]
@@ -169,44 +168,30 @@ for piece in range(6):
         eg_table[pieces.white][piece][pos] = eg_black_tables[piece][pos ^ 56]
 
 game_phase_inc = [0, 1, 1, 2, 4, 0]
+# the game phase when every starting piece is still on the board
+max_game_phase = 24
 
+# material plus piece square value of a piece on a position
+# these are what bitboard.Board accumulates into its mg_scores and eg_scores
+mg_piece_values = [[[mg_values[piece] + mg_table[colour][piece][pos] for pos in range(64)] for piece in range(6)]
+                   for colour in range(2)]
+eg_piece_values = [[[eg_values[piece] + eg_table[colour][piece][pos] for pos in range(64)] for piece in range(6)]
+                   for colour in range(2)]
 
-def evaluate(board: bitboard.Board):
+
+def evaluate(board):
     """
     evaluates how good a board is for the board's current colour
+    uses the scores that the bitboard.Board keeps updated with each move
     """
     # calculate the game phase. higher = early game, lower = late game
-    game_phase = 0
-    for piece in range(1,5):
-        game_phase += board.positions[pieces.white][piece].bit_count() * game_phase_inc[piece]
-        game_phase += board.positions[pieces.black][piece].bit_count() * game_phase_inc[piece]
-
-    game_phase = max(game_phase, 24)
-
-    return evaluate_colour(board, board.colour, game_phase) - evaluate_colour(board, not board.colour, game_phase)
-
-
-def evaluate_colour(board, colour, mg_phase):
-    mg, eg = 0, 0
-
-    # get score sums
-    for piece in range(6):
-        mg += board.positions[colour][piece].bit_count() * mg_values[piece]
-        eg += board.positions[colour][piece].bit_count() * eg_values[piece]
-
-    # get piece square values
-    for piece in range(6):
-        for pos in bitboard.iter_bitmap(board.positions[colour][piece]):
-            mg += mg_table[colour][piece][pos]
-            eg += eg_table[colour][piece][pos]
-
+    # promotions can take the phase above its starting value, so clamp it
+    mg_phase = min(board.game_phases[pieces.white] + board.game_phases[pieces.black], max_game_phase)
     # the end-game phase is the opposite of the mid-game phase
-    eg_phase = 24 - mg_phase
-
-    # map the result between mg and eg
-    res = (mg * mg_phase + eg * eg_phase) // 24
-
-    return res
-
+    eg_phase = max_game_phase - mg_phase
 
+    mg = board.mg_scores[board.colour] - board.mg_scores[not board.colour]
+    eg = board.eg_scores[board.colour] - board.eg_scores[not board.colour]
 
+    # map the result between mg and eg
+    return (mg * mg_phase + eg * eg_phase) // max_game_phase
@@ -1,5 +1,6 @@
 from engine import move
 
+from collections import OrderedDict
 from enum import Enum
 
 
@@ -27,7 +28,7 @@ class TTEntry:
 class TranspositionTable:
     def __init__(self, size):
         self.size = size
-        self.table = [TTEntry(0, -99999, move.Move(0, 0), 0, NodeType.exact) for _ in range(size)]
+        self.table = [TTEntry(0, -99999, move.no_move, 0, NodeType.exact) for _ in range(size)]
 
     def __getitem__(self, zobrist):
         return self.table[zobrist % self.size]
@@ -45,8 +46,50 @@ class TranspositionTable:
         else:
             return False
 
+    def get_move(self, zobrist):
+        """
+        the best move stored for a position, or move.no_move if the position isn't stored
+        """
+        entry = self[zobrist]
+        if entry.zobrist != zobrist or entry.move is None:
+            return move.no_move
+        return entry.move
+
     def replace(self, entry):
         self.table[entry.zobrist % self.size] = entry
 
 
+class MoveCache:
+    def __init__(self, size):
+        """
+        remembers the legal moves of the last size positions they were asked for in, keyed by zobrist hash
+        moves are stored as frozensets, so checking whether a move is legal doesn't scan a list
+        when it is full the least recently used position is thrown out
+        an entry only depends on the position, not how it was reached, so entries stay correct after unmaking moves
+        """
+        self.size = size
+        self.table = OrderedDict()
+        self.hits = 0
+
+    def get_legal_moves(self, generator):
+        """
+        returns a frozenset of the legal moves in generator's board, only generating them if they aren't stored
+        """
+        zobrist = generator.board.zobrist
+        moves = self.table.get(zobrist)
+        if moves is not None:
+            self.hits += 1
+            self.table.move_to_end(zobrist)
+            return moves
+
+        moves = frozenset(generator.get_legal_moves())
+        self.table[zobrist] = moves
+        if len(self.table) > self.size:
+            self.table.popitem(last=False)
+        return moves
+
+    def clear(self):
+        self.table.clear()
+
+
 
@@ -106,7 +106,7 @@ class Interface:
         if self.current_screen == Screens.game:
             # update move_display
             if len(self.move_display.move_texts) != len(self.game.board.past_moves):
-                self.move_display.add_move(self.game.board.past_moves[-1].notate())
+                self.move_display.add_move(engine.move.notate(self.game.board.past_moves[-1]))
 
             self.move_display.update()
             self.game_state = self.game.update(self.events)
@@ -123,7 +123,7 @@ class Interface:
         self.running = False
 
     def undo_move(self):
-        if self.game.board.logs:
+        if self.game.board.past_moves:
             self.game.board.unmake_move()
             self.game.current_legal_moves = None
             self.move_display.pop_move()